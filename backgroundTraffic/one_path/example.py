@@ -17,6 +17,7 @@ from mininet.util import dumpNodeConnections
 from mininet.log import setLogLevel
 
 from random import random
+import sys
     
 class MyTopo(Topo):
     "Single switch connected to n hosts."
@@ -66,6 +67,10 @@ def main():
     c0 = RemoteController( 'c0', controller=RemoteController, ip='0.0.0.0' ,port = 6633)
     net.addController(c0)
     net.start()
+    if 'probe' in sys.argv[1:]:
+        # h1发送probe，同时k4向k2发送背景流
+        import probedriver
+        print "probe log:", probedriver.run(net, background = [(4, 2)])
     CLI(net)
     net.stop()
 
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+在Mininet中启动probe发送进程
+monitoring只为h1(10.0.0.1)发往10.0.0.2的probe安装了探测树，所以probe只能由h1发送；
+其他主机k<i>(交换机i上，ip为10.0.0.(i+10))之间有host路由，可以同时发送背景流
+每个进程绑定到一个cpu，所有进程在同一时刻开始发送，输出汇总到一个日志文件
+sender都绑定源端口9999，每个主机只能有一个sender
+"""
+import multiprocessing
+import os
+import time
+from subprocess import STDOUT
+
+from mininet.util import pmonitor
+
+SENDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'udpsender.py')
+MONITOR = ('h1', '10.0.0.1')
+
+def host_ip(node):
+    return '10.0.0.%s' % (node + 10)
+
+def run(net, dst = '10.0.0.2', lead = 2.0, measure_time = 20, background = ()):
+    """
+    lead秒后h1和background中的所有sender同时开始发送，每个发送measure_time秒
+    background为 [(i, j)]，k<i>向k<j>发送，同一个i只能出现一次
+    返回汇总日志的文件名
+    """
+    sources = [i for i, j in background]
+    repeated = sorted(set(i for i in sources if sources.count(i) > 1))
+    if repeated:
+        raise ValueError("background senders reuse source host %s" % ", ".join("k%d" % i for i in repeated))
+    start_at = time.time() + lead
+    senders = [(MONITOR[0], MONITOR[1], dst)]
+    senders += [('k%d' % i, host_ip(i), host_ip(j)) for i, j in background]
+    ncpu = multiprocessing.cpu_count()
+    # {sender序号: Popen}
+    popens = {}
+    for cpu, (name, src, to) in enumerate(senders):
+        host = net.get(name)
+        # 每个sender绑定一个cpu，避免在同一个核上互相抢占
+        popens[cpu] = host.popen(['taskset', '-c', str(cpu % ncpu),
+                                   'python', '-u', SENDER, src, to, repr(start_at), str(measure_time)],
+                                  stderr=STDOUT)
+    log = 'probes_%s.log' % time.strftime("%Y_%m_%d_%H:%M:%S")
+    with open(log, 'w') as f:
+        for i, line in pmonitor(popens):
+            if line:
+                f.write('%s %s' % (senders[i][0], line))
+    return log
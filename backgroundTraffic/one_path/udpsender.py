@@ -14,21 +14,24 @@ PORT = 10000
 BUFSIZ = 1024
 ADDR = (HOST, PORT)
 
-udpCliSock = socket(AF_INET, SOCK_DGRAM)
-udpCliSock.bind(('10.0.0.1', 9999))
-
 interval = 0.002
 time_interval = 0.490
 period = 5.0
 measure_time = 20
-n = int((measure_time/period) * 5 *(period / (interval*5 + time_interval)))
-# print n
-# n = 1
 
-def main():
+def main(src = '10.0.0.1', dst = HOST, start_at = None, measure_time = measure_time):
+    """
+    从src向dst发送probe，start_at为开始发送的绝对时间，用于多个sender同时开始
+    """
+    n = int((measure_time/period) * 5 *(period / (interval*5 + time_interval)))
+    udpCliSock = socket(AF_INET, SOCK_DGRAM)
+    udpCliSock.bind((src, 9999))
+    addr = (dst, PORT)
+    if start_at is not None:
+        time.sleep(max(0, start_at - time.time()))
     for i in range(n):
         data = repr((i, time.time()))
-        udpCliSock.sendto(data, ADDR)
+        udpCliSock.sendto(data, addr)
         # if i%500==0:
         #     print("send %d probe packet."%i)
         if i % 5 == 0:
@@ -38,4 +41,12 @@ def main():
     udpCliSock.close()
 
 if __name__ == '__main__':
-    main()
+    # usage: udpsender.py [src dst [start_at [measure_time]]]
+    if len(sys.argv) > 4:
+        main(sys.argv[1], sys.argv[2], float(sys.argv[3]), float(sys.argv[4]))
+    elif len(sys.argv) > 3:
+        main(sys.argv[1], sys.argv[2], float(sys.argv[3]))
+    elif len(sys.argv) > 2:
+        main(sys.argv[1], sys.argv[2])
+    else:
+        main()
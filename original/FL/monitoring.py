@@ -13,46 +13,98 @@ from pox.lib.recoco import Timer
 from datetime import datetime
 from collections import defaultdict
 from collections import namedtuple
+from collections import OrderedDict
 import pox.lib.packet as pkt
 #from pox.openflow.of_json import flow_stats_to_list
 import struct
 from pox.lib.addresses import IPAddr,EthAddr
 import time
 
+from pathid import PathId
+
 log = core.getLogger()
 switches = {}
 switch_ports = {}
 adj = defaultdict(lambda:defaultdict(lambda:None))
 
+# 收到第一个NewMonitor后等待SETTLE秒再编译下发，期间同一个monitor的事件合并为一次
+SETTLE = 1.0
+# 临时丢弃probe的流表的超时时间(秒)，避免流表生效前每个probe都上报控制器
+SUPPRESS_TIMEOUT = 5
+# 等待discovery发现所有链路的最长时间(秒)，超时后报告缺少的链路并照常下发
+DISCOVERY_TIMEOUT = 30
+# 下发后等待barrier回复的最长时间(秒)，超时后报告没有回复的交换机
+BARRIER_TIMEOUT = 10
+
+def _probe_match(monitor, in_port, nw_src):
+    match = monitor.match.clone()
+    match.tp_dst, match.tp_src = (None,) * 2
+    match.nw_src = nw_src
+    match.nw_dst = IPAddr('10.0.0.2')
+    match.in_port = in_port
+    return match
+
+def _linked(a, b):
+    # 两个方向的端口都已知
+    return adj[a][b] is not None and adj[b][a] is not None
+
+def compile_probe_tree(monitor, adj_path, switches_ip, path_id):
+    """
+    深度优先遍历adj_path前缀树，生成所有交换机的流表，返回 [(dpid, ofp_flow_mod)]
+    每个树节点只访问一次，path长度不限：
+    向下: 收到上一层的probe后转发给下一层，修改udp源端口后发送回上一层
+    向上: 收到下一层返回的probe后转发给上一层
+    第一层节点把ip源地址改为自己的ip，之后各层用它区分属于哪一棵子树
+    discovery没有发现的链路下面的子树整个跳过，不生成流表也不分配path id
+    """
+    rules = []
+
+    def walk(prefix, children):
+        node = prefix[-1]
+        parent = prefix[-2] if len(prefix) > 1 else monitor.dpid
+        children = OrderedDict((child, children[child]) for child in children if _linked(node, child))
+        if len(prefix) == 1:
+            msg = of.ofp_flow_mod(match=_probe_match(monitor, adj[node][parent], IPAddr('10.0.0.1')))
+            msg.actions.append(of.ofp_action_nw_addr.set_src(nw_addr = switches_ip[node]))
+        else:
+            msg = of.ofp_flow_mod(match=_probe_match(monitor, adj[node][parent], switches_ip[prefix[0]]))
+        for child in children:
+            msg.actions.append(of.ofp_action_output(port=adj[node][child]))
+        #修改udp_port,发送回上一层
+        msg.actions.append(of.ofp_action_tp_port.set_src(tp_port=path_id[(24,) + prefix]))
+        msg.actions.append(of.ofp_action_output(port=of.OFPP_IN_PORT))
+        rules.append((node, msg))
+
+        for child in children:
+            #往上转发
+            msg = of.ofp_flow_mod(match=_probe_match(monitor, adj[node][child], switches_ip[prefix[0]]))
+            msg.actions.append(of.ofp_action_output(port=adj[node][parent]))
+            rules.append((node, msg))
+            walk(prefix + (child,), children[child])
+
+    adj_path = OrderedDict((node, adj_path[node]) for node in adj_path if _linked(monitor.dpid, node))
+    #r24收到h1的probe后，转发给第一层
+    msg = of.ofp_flow_mod(match=_probe_match(monitor, monitor.switch_port, IPAddr('10.0.0.1')))
+    for node in adj_path:
+        msg.actions.append(of.ofp_action_output(port=adj[monitor.dpid][node]))
+    rules.append((monitor.dpid, msg))
+
+    for node in adj_path:
+        #r24收到第一层返回的probe后，修改地址发给monitor
+        msg = of.ofp_flow_mod(match=_probe_match(monitor, adj[monitor.dpid][node], None))
+        msg.actions.append(of.ofp_action_nw_addr.set_dst(nw_addr = monitor.ip))
+        msg.actions.append(of.ofp_action_nw_addr.set_src(nw_addr = IPAddr('10.0.0.2')))
+        msg.actions.append(of.ofp_action_dl_addr.set_dst(dl_addr = monitor.hw))
+        msg.actions.append(of.ofp_action_dl_addr.set_src(dl_addr = EthAddr("00:00:00:00:00:02")))
+        msg.actions.append(of.ofp_action_output(port=monitor.switch_port))
+        rules.append((monitor.dpid, msg))
+        walk((node,), adj_path[node])
+    return rules
+
 def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
-    switches_ip, path_id, switches_mac = {}, {}, {}
+    switches_ip, switches_mac = {}, {}
 
-    class Path_id():
-        """
-        随机为每一个path分配一个固定udp端口号
-        """
-        def __init__(self):
-            self.id_dict = {}
-            # 去除9999
-            self.id_list = (9999,)
-
-        def __getitem__(self, path):
-            if path in self.id_dict.keys():
-                return self.id_dict[path]
-            x = path
-            if not isinstance(path, tuple):
-                x = tuple(path)
-            i = hash(x)%(1<<15)
-            while i in self.id_list:
-                i = (i + 1)%(1<<15)
-            self.id_list = self.id_list + (i,)
-            self.id_dict[path] = i
-            return i
-
-        def keys(self):
-            return self.id_dict.keys()
-            
-    path_id = Path_id()
+    path_id = PathId()
     def topo_conf():
         """
         Each switch is configed with a ip address. You can config it with files yourself .
@@ -61,135 +113,10 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
             switches_ip[k] = IPAddr((192<<24)+int(k))
             switches_mac[k] = EthAddr("aa"+ "%010d"%(k))
 
-    def install_SDN_path():
-        #根节点收到上面的probe后
-        for node in adj_path.keys():
-            msg = of.ofp_flow_mod(match=monitor.match.clone())
-            #匹配
-            msg.match.tp_dst, msg.match.tp_src = (None,) * 2
-            msg.match.nw_src = IPAddr('10.0.0.1')
-            msg.match.nw_dst = IPAddr('10.0.0.2')
-            msg.match.in_port = adj[node][monitor.dpid]
-            #modify ip and 向下转发
-            msg.actions.append(of.ofp_action_nw_addr.set_src(nw_addr = switches_ip[node]))
-            for nextnode in adj_path[node].keys():
-                msg.actions.append(of.ofp_action_output(port=adj[node][nextnode]))
-            #修改udp_port,发送回r24
-            temp_path = []
-            temp_path.append(24)
-            temp_path.append(node)
-            temp_path = tuple(temp_path)
-            msg.actions.append(of.ofp_action_tp_port.set_src(tp_port=path_id[temp_path]))
-            msg.actions.append(of.ofp_action_output(port=of.OFPP_IN_PORT))
-            switches[node].connection.send(msg)
-
-        #第二层节点收到第一层的probe以后
-        for node in adj_path.keys():
-            for nextnode in adj_path[node].keys():
-                msg = of.ofp_flow_mod(match=monitor.match.clone())
-                # 匹配
-                msg.match.tp_dst, msg.match.tp_src = (None,) * 2
-                msg.match.nw_src = switches_ip[node]
-                msg.match.nw_dst = IPAddr('10.0.0.2')
-                msg.match.in_port = adj[nextnode][node]
-                # 向下转发
-                for lastnode in adj_path[node][nextnode]:
-                    msg.actions.append(of.ofp_action_output(port=adj[nextnode][lastnode]))
-                #modify and send back
-                temp_path = []
-                temp_path.append(24)
-                temp_path.append(node)
-                temp_path.append(nextnode)
-                temp_path = tuple(temp_path)
-                msg.actions.append(of.ofp_action_tp_port.set_src(tp_port=path_id[temp_path]))
-                msg.actions.append(of.ofp_action_output(port=of.OFPP_IN_PORT))
-                switches[nextnode].connection.send(msg)
-
-        #第三层节点收到probe以后
-        for node in adj_path.keys():
-            for nextnode in adj_path[node].keys():
-                for lastnode in adj_path[node][nextnode]:
-                    msg = of.ofp_flow_mod(match=monitor.match.clone())
-                    # 匹配
-                    msg.match.tp_dst, msg.match.tp_src = (None,) * 2
-                    msg.match.nw_src = switches_ip[node]
-                    msg.match.nw_dst = IPAddr('10.0.0.2')
-                    msg.match.in_port = adj[lastnode][nextnode]
-                    #转发回去
-                    temp_path = []
-                    temp_path.append(24)
-                    temp_path.append(node)
-                    temp_path.append(nextnode)
-                    temp_path.append(lastnode)
-                    temp_path = tuple(temp_path)
-                    msg.actions.append(of.ofp_action_tp_port.set_src(tp_port=path_id[temp_path]))
-                    msg.actions.append(of.ofp_action_output(port=of.OFPP_IN_PORT))
-                    switches[lastnode].connection.send(msg)
-
-        #第二层节点收到第三层的probe以后
-        for node in adj_path.keys():
-            for nextnode in adj_path[node].keys():
-                for lastnode in adj_path[node][nextnode]:
-                    msg = of.ofp_flow_mod(match=monitor.match.clone())
-                    # 匹配
-                    msg.match.tp_dst, msg.match.tp_src = (None,) * 2
-                    msg.match.nw_src = switches_ip[node]
-                    msg.match.nw_dst = IPAddr('10.0.0.2')
-                    msg.match.in_port = adj[nextnode][lastnode]
-                    #往上转发
-                    msg.actions.append(of.ofp_action_output(port=adj[nextnode][node]))
-                    switches[nextnode].connection.send(msg)
-
-        #第一层节点收到第二层的probe以后
-        for node in adj_path.keys():
-            for nextnode in adj_path[node].keys():
-                msg = of.ofp_flow_mod(match=monitor.match.clone())
-                msg.match.tp_dst, msg.match.tp_src = (None,) * 2
-                msg.match.nw_src = switches_ip[node]
-                msg.match.nw_dst = IPAddr('10.0.0.2')
-                msg.match.in_port = adj[node][nextnode]
-                #往上转发
-                msg.actions.append(of.ofp_action_output(port=adj[node][monitor.dpid]))
-                switches[node].connection.send(msg)
-
-                log.debug('monitor num')
-
-        for node in adj_path.keys():
-            msg = of.ofp_flow_mod()
-            msg.match = monitor.match.clone()   
-            
-            #匹配
-            msg.match.nw_src, msg.match.tp_dst, msg.match.tp_src = (None,) * 3
-            #msg.match.nw_src = IPAddr('10.0.0.1')
-            msg.match.nw_dst = IPAddr('10.0.0.2')
-            msg.match.in_port = adj[monitor.dpid][node]
-
-            #修改IP
-            # msg.actions.append(of.ofp_action_nw_addr.set_dst(nw_addr = IPAddr('10.0.0.2')))
-            # msg.actions.append(of.ofp_action_dl_addr.set_dst(dl_addr = EthAddr("00:00:00:00:00:02")))            # msg.actions.append(of.ofp_action_dl_addr.set_dst(dl_addr = EthAddr("00:00:00:00:00:02")))            #向上转发
-            msg.actions.append(of.ofp_action_nw_addr.set_dst(nw_addr = monitor.ip))
-            msg.actions.append(of.ofp_action_nw_addr.set_src(nw_addr = IPAddr('10.0.0.2')))
-            msg.actions.append(of.ofp_action_dl_addr.set_dst(dl_addr = monitor.hw))
-            msg.actions.append(of.ofp_action_dl_addr.set_src(dl_addr = EthAddr("00:00:00:00:00:02")))
-            msg.actions.append(of.ofp_action_output(port=monitor.switch_port))
-            switches[monitor.dpid].connection.send(msg)
-
-        #r24收到h1的probe后
-        msg = of.ofp_flow_mod()
-        msg.match = monitor.match.clone()  
-        #匹配h1
-        msg.match.tp_dst, msg.match.tp_src = (None,) * 2
-        msg.match.nw_src = IPAddr('10.0.0.1')
-        msg.match.nw_dst = IPAddr('10.0.0.2')
-        msg.match.in_port = monitor.switch_port
-        #转发
-        for node in adj_path.keys():
-            msg.actions.append(of.ofp_action_output(port=adj[monitor.dpid][node]))
-        switches[monitor.dpid].connection.send(msg)
-
     topo_conf()
     # install_r_flow()
-    install_SDN_path()
+    rules = compile_probe_tree(monitor, adj_path, switches_ip, path_id)
+    path_id.save()
     # log.debug(path_id)
     with open("id_path.txt", "w") as f:
         # 将每条路径的udp端口号和路径写入文件，udphandler.py根据这个区分不同测量路径
@@ -198,17 +125,119 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
             f.write("%6s -> " % path_id[p])
             f.write("%s " * len(p) % p)
             f.write("\n")
+    return rules
 
-def _build_monitoring_topo(monitor):
+def _build_monitoring_topo(monitor, topo=None):
 
     from readtopo import readtopo
-    links, monitors, paths, adj_path = readtopo()
+    links, monitors, paths, adj_path = topo or readtopo()
     log.debug('build monitor')
-    _install_monitoring_path(monitor, monitors, paths, links, adj_path)
+    return _install_monitoring_path(monitor, monitors, paths, links, adj_path)
+
+class LinkIndex(object):
+    """
+    discovery发现的链路 {(dpid1, dpid2): port1}，同时维护adj
+    """
+    def __init__(self):
+        self.ports = {}
+
+    def add(self, link):
+        self.ports[(link.dpid1, link.dpid2)] = link.port1
+        adj[link.dpid1][link.dpid2] = link.port1
+
+    def remove(self, link):
+        if self.ports.pop((link.dpid1, link.dpid2), None) is not None:
+            adj[link.dpid1].pop(link.dpid2, None)
+
+    def missing(self, expected):
+        return sorted(l for l in expected if l not in self.ports)
+
+def expected_links(root, links, adj_path):
+    """
+    编译流表需要的有向链路: result.txt中的所有链路和根节点到第一层节点的链路
+    """
+    expected = set()
+    for a, b in list(links) + [(root, node) for node in adj_path]:
+        expected.add((a, b))
+        expected.add((b, a))
+    return expected
+
+def _rule_key(msg):
+    # OpenFlow用match和priority区分一条流表
+    return msg.match.pack(), msg.priority
+
+def _actions(msg):
+    return b''.join(action.pack() for action in msg.actions)
+
+def diff_rules(installed, rules):
+    """
+    比较已安装的流表和新编译的流表，只返回需要下发的消息 [(dpid, ofp_flow_mod)]
+    installed: {dpid: {key: ofp_flow_mod}}，原地更新为新的流表
+    新增的用ADD，actions变化的用MODIFY_STRICT，不再需要的用DELETE_STRICT
+    """
+    compiled = defaultdict(dict)
+    for dpid, msg in rules:
+        compiled[dpid][_rule_key(msg)] = msg
+    changes = []
+    for dpid in set(installed) | set(compiled):
+        old, new = installed.get(dpid, {}), compiled.get(dpid, {})
+        for key, msg in new.items():
+            if key not in old:
+                changes.append((dpid, msg))
+            elif _actions(old[key]) != _actions(msg):
+                msg.command = of.OFPFC_MODIFY_STRICT
+                changes.append((dpid, msg))
+        for key, msg in old.items():
+            if key not in new:
+                changes.append((dpid, of.ofp_flow_mod(command=of.OFPFC_DELETE_STRICT,
+                                                      match=msg.match, priority=msg.priority)))
+        if new:
+            installed[dpid] = new
+        else:
+            installed.pop(dpid, None)
+    return changes
+
+class MonitoringReady(Event):
+    """
+    所有交换机都回复了barrier，监测流表已经生效
+    rules: 本次实际下发的流表消息数(增加、修改和删除)
+    elapsed: 从开始下发到最后一个barrier回复的时间(秒)
+    switch_time: {dpid: 该交换机从下发到barrier回复的时间(秒)}
+    """
+    def __init__(self, rules, elapsed, switch_time):
+        Event.__init__(self)
+        self.rules = rules
+        self.elapsed = elapsed
+        self.switch_time = switch_time
+
+class Monitoring (EventMixin):
+    _eventMixin_events = set([
+                            MonitoringReady,
+                            ])
 
-class Monitoring (object):        
     def __init__ (self):
         log.debug("Monitoring coming up")
+        # barrier xid -> (下发编号, dpid)，旧的下发的barrier回复直接忽略
+        self.barriers = {}
+        # 下发编号，每次实际下发流表时加一
+        self.generation = 0
+        # 本次下发还没有回复barrier的交换机
+        self.waiting = set()
+        self.install_start = None
+        self.switch_time = {}
+        self.rule_count = 0
+        # 每个交换机上已安装的监测流表 {dpid: {(match, priority): ofp_flow_mod}}
+        self.installed = {}
+        # 已处理的monitor {(dpid, port, ip, hw): NewMonitor}
+        self.monitors = {}
+        # 等待下发的monitor
+        self.pending = []
+        self.settle_timer = None
+        # 上一次编译下发时使用的monitor，交换机重连时用它重新下发
+        self.last_monitor = None
+        self.links = LinkIndex()
+        # 第一个等待下发的NewMonitor的时间
+        self.wait_start = None
         def startup():
             # 监听_handle_LinkEvent事件
             core.openflow_discovery.addListeners(self)
@@ -221,15 +250,121 @@ class Monitoring (object):
 
     def _handle_ConnectionUp (self, event):
         switches[event.connection.dpid] = event
+        # 重新连接的交换机流表为空，用上一次下发时的monitor重新编译，只补发这个交换机的流表
+        if self.installed.pop(event.connection.dpid, None) is not None and self.last_monitor is not None:
+            log.debug("switch %s reconnected, reinstalling monitoring rules", event.connection.dpid)
+            self._queue(self.last_monitor)
       
     def _handle_NewMonitor(self, event):
+        key = (event.dpid, event.switch_port, event.ip, event.hw)
+        if key in self.monitors:
+            return
         log.debug("_handle_NewMonitor")
-        _build_monitoring_topo(event)
+        self.monitors[key] = event
+        self._queue(event)
+
+    def _queue(self, monitor):
+        """
+        加入等待下发的monitor，SETTLE秒后编译下发
+        """
+        self.pending.append(monitor)
+        self._suppress(monitor)
+        if self.settle_timer is None:
+            self.wait_start = time.time()
+            self.settle_timer = Timer(SETTLE, self._settle)
+
+    def _suppress(self, monitor):
+        """
+        在monitor的交换机上临时丢弃probe，优先级低于监测流表，监测流表生效后不再起作用
+        """
+        msg = of.ofp_flow_mod(match=monitor.match.clone())
+        msg.match.tp_dst, msg.match.tp_src = (None,) * 2
+        msg.priority = of.OFP_DEFAULT_PRIORITY - 1
+        msg.hard_timeout = SUPPRESS_TIMEOUT
+        switches[monitor.dpid].connection.send(msg)
+
+    def _settle(self):
+        from readtopo import readtopo
+        self.settle_timer = None
+        # 和之前一样以最后一个monitor为准，整个窗口只编译下发一次
+        monitor = self.pending[-1]
+        topo = readtopo()
+        links, monitors, paths, adj_path = topo
+        missing = self.links.missing(expected_links(monitor.dpid, links, adj_path))
+        if missing:
+            if time.time() - self.wait_start < DISCOVERY_TIMEOUT:
+                log.debug("waiting for discovery, %d links missing", len(missing))
+                # 等待时间可能超过SUPPRESS_TIMEOUT，每次重新等待时重发丢弃规则，刷新hard_timeout
+                for m in self.pending:
+                    self._suppress(m)
+                self.settle_timer = Timer(SETTLE, self._settle)
+                return
+            # 用到缺失链路的子树不下发流表
+            log.warning("discovery timeout, %d links missing, skipping the paths behind them: %s", len(missing),
+                        " ".join("%s->%s" % l for l in missing))
+        pending, self.pending = self.pending, []
+        self.last_monitor = monitor
+        log.debug("settled %d monitor(s)", len(pending))
+        self._install(diff_rules(self.installed, _build_monitoring_topo(monitor, topo)))
+
+    def _install(self, rules):
+        """
+        按交换机分组，每个交换机的流表打包后一次写入，最后发送barrier
+        """
+        if not rules:
+            # 没有变化时不影响还在等待回复的上一次下发，上一次的barrier都回复后由它发出MonitoringReady
+            log.debug("monitoring rules unchanged")
+            if not self.waiting:
+                self.raiseEvent(MonitoringReady(0, 0.0, {}))
+            return
+        per_switch = defaultdict(list)
+        for dpid, msg in rules:
+            per_switch[dpid].append(msg)
+        if self.waiting:
+            log.debug("install %d superseded, %d switches did not reply", self.generation, len(self.waiting))
+        self.generation += 1
+        self.install_start = time.time()
+        self.switch_time = {}
+        self.rule_count = len(rules)
+        self.waiting = set(per_switch)
+        for dpid, msgs in per_switch.items():
+            connection = switches[dpid].connection
+            connection.send(b''.join(msg.pack() for msg in msgs))
+            barrier = of.ofp_barrier_request()
+            connection.send(barrier)
+            self.barriers[barrier.xid] = (self.generation, dpid)
+        Timer(BARRIER_TIMEOUT, self._barrier_timeout, args = [self.generation])
+        log.debug("sent %d rules to %d switches", len(rules), len(per_switch))
+
+    def _barrier_timeout(self, generation):
+        # 去掉这次下发不会再回复的barrier
+        for xid, (g, dpid) in self.barriers.items():
+            if g == generation:
+                del self.barriers[xid]
+        if generation != self.generation or not self.waiting:
+            return
+        log.warning("monitoring install %d: no barrier reply after %ds from switches %s",
+                    generation, BARRIER_TIMEOUT, " ".join(str(d) for d in sorted(self.waiting)))
+
+    def _handle_BarrierIn(self, event):
+        generation, dpid = self.barriers.pop(event.xid, (None, None))
+        if generation != self.generation or dpid not in self.waiting:
+            return
+        self.waiting.discard(dpid)
+        self.switch_time[dpid] = time.time() - self.install_start
+        if self.waiting:
+            return
+        elapsed = max(self.switch_time.values())
+        slowest = max(self.switch_time, key=self.switch_time.get)
+        log.info("monitoring ready: %d rules on %d switches in %.3fs, slowest switch %s %.3fs",
+                 self.rule_count, len(self.switch_time), elapsed, slowest, elapsed)
+        self.raiseEvent(MonitoringReady(self.rule_count, elapsed, self.switch_time))
     
     def _handle_LinkEvent(self, event):
-        link = event.link
         if event.added:
-            adj[link.dpid1][link.dpid2] = link.port1
+            self.links.add(event.link)
+        elif event.removed:
+            self.links.remove(event.link)
             
 def launch ():
     # 注册Monitoring组件
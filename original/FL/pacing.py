@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+probe发送节奏控制
+每个probe的发送时刻是相对开始时间的绝对deadline，sleep的误差不会累积；
+离deadline很近时改为忙等，精度可以到几十微秒
+"""
+import math
+import random
+import time
+
+try:
+    from time import monotonic
+except ImportError:
+    import ctypes
+    import ctypes.util
+
+    class _timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    _librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+    CLOCK_MONOTONIC = 1
+
+    def monotonic():
+        t = _timespec()
+        if _librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            raise OSError(ctypes.get_errno(), "clock_gettime failed")
+        return t.tv_sec + t.tv_nsec * 1e-9
+
+# 以下pattern产生[0, duration)内每个probe相对开始时间的发送时刻
+
+def constant(duration, interval=0.002):
+    """
+    每interval秒发送一个probe
+    """
+    for i in range(int(round(duration / interval))):
+        yield i * interval
+
+def burst(duration, interval=0.002, size=5, gap=0.490):
+    """
+    每size个probe为一组，组内间隔interval，组与组之间间隔gap
+    """
+    t, i = 0.0, 0
+    while t < duration:
+        yield t
+        i += 1
+        t += gap if i % size == 0 else interval
+
+def poisson(duration, interval=0.002, seed=None):
+    """
+    发送间隔服从均值为interval的指数分布
+    """
+    r = random.Random(seed)
+    t = 0.0
+    while t < duration:
+        yield t
+        t += r.expovariate(1.0 / interval)
+
+PATTERNS = {
+    'constant': constant,
+    'burst': burst,
+    'poisson': poisson,
+}
+
+class Pacer(object):
+    """
+    for i in Pacer(constant(60)): send(i)
+    每次迭代在对应的deadline返回probe序号，并统计实际发送时刻与deadline的偏差
+    """
+    def __init__(self, offsets, spin=0.0005):
+        self.offsets = offsets
+        self.spin = spin
+        self.n = 0
+        self.last_offset = 0.0
+        # 开始到最后一个probe发出的时间，中途停止迭代时也有效
+        self.elapsed = 0.0
+        self.late_sum = self.late_sq = self.late_max = 0.0
+
+    def __iter__(self):
+        self.start = monotonic()
+        for i, offset in enumerate(self.offsets):
+            deadline = self.start + offset
+            now = monotonic()
+            if deadline - now > self.spin:
+                time.sleep(deadline - now - self.spin)
+            while now < deadline:
+                now = monotonic()
+            late = now - deadline
+            self.n += 1
+            self.last_offset = offset
+            self.late_sum += late
+            self.late_sq += late * late
+            self.late_max = max(self.late_max, late)
+            self.elapsed = now - self.start
+            yield i
+
+    def report(self):
+        """
+        请求的和实际的发送速率，以及相对deadline的抖动
+        """
+        if self.n < 2:
+            return "sent %d probes" % self.n
+        mean = self.late_sum / self.n
+        std = math.sqrt(max(self.late_sq / self.n - mean * mean, 0))
+        return "sent %d probes, requested %.1f pps, achieved %.1f pps, jitter mean %.1fus std %.1fus max %.1fus" % (
+            self.n, (self.n - 1) / self.last_offset, (self.n - 1) / self.elapsed,
+            mean * 1e6, std * 1e6, self.late_max * 1e6)
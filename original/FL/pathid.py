@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+为每一个path分配固定的udp端口号
+端口号由path的crc32决定，冲突时顺序向后找空闲端口，用dict和端口占用表实现，分配为O(1)
+分配结果保存在path_id.pkl中，下次运行时同一个path得到同一个端口号，
+udphandler也直接读取这个文件
+"""
+import os
+import pickle
+import zlib
+
+FILE = 'path_id.pkl'
+PORTS = 1 << 15
+# 不能分配的端口，9999为udpsender的源端口
+RESERVED = (0, 9999)
+
+def _port_of(path):
+    return zlib.crc32(' '.join(str(node) for node in path)) % PORTS
+
+class PathId(object):
+    """
+    path_id[path] 返回path的端口号，没有时分配一个新的
+    keys() 只包含本次运行用到的path，按分配顺序
+    """
+    def __init__(self, filename=FILE):
+        self.filename = filename
+        self.ids = {}
+        self.used = bytearray(PORTS)
+        self.active = []
+        self.active_set = set()
+        for port in RESERVED:
+            self.used[port] = 1
+        if filename is not None and os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                self.ids = pickle.load(f)['ids']
+            for port in self.ids.values():
+                self.used[port] = 1
+
+    def __getitem__(self, path):
+        path = tuple(path)
+        i = self.ids.get(path)
+        if i is None:
+            i = _port_of(path)
+            while self.used[i]:
+                i = (i + 1) % PORTS
+            self.used[i] = 1
+            self.ids[path] = i
+        if path not in self.active_set:
+            self.active_set.add(path)
+            self.active.append(path)
+        return i
+
+    def keys(self):
+        return list(self.active)
+
+    def save(self):
+        with open(self.filename, 'wb') as f:
+            pickle.dump({'ids': self.ids, 'active': self.active}, f, 2)
+
+def load(filename=FILE):
+    """
+    读入上次运行用到的path，返回 {端口号: path}
+    """
+    with open(filename, 'rb') as f:
+        data = pickle.load(f)
+    return dict((data['ids'][p], p) for p in data['active'])
@@ -1,66 +1,106 @@
 #!/bin/bash/env python
 #-*- coding: utf-8 -*-
 
-def readtopo():
+"""
+解析result.txt，读入topo信息
+解析结果按文件的修改时间缓存在内存中，同一个进程内只解析一次
+解析本身不到1ms，反序列化磁盘缓存并不比重新解析快，所以不写磁盘缓存
+"""
+import os
+from collections import OrderedDict
+
+RESULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result.txt')
+
+class Topology(object):
+    """
+    nodes: 所有交换机  links: 无向链路列表(按文件中第一次出现的顺序)  link_set: 两个方向的链路
+    monitors: 第一层节点  paths: path列表  adj_path: 所有path构成的前缀树
+    节点编号都是文件中的编号+1
+    """
+    def __init__(self, monitors, paths, links):
+        self.monitors = monitors
+        self.paths = paths
+        self.links = []
+        self.link_set = set()
+        for a, b in links:
+            if (a, b) not in self.link_set:
+                self.links.append((a, b))
+                self.link_set.add((a, b))
+                self.link_set.add((b, a))
+        self.nodes = frozenset(n for l in self.links for n in l)
+        # 所有path构成的前缀树 adj_path[p0][p1][p2]...，叶子为空dict，path长度不限
+        # 子节点保持result.txt中的顺序
+        self.adj_path = OrderedDict()
+        for p in paths:
+            t = self.adj_path
+            for node in p:
+                if node not in t:
+                    t[node] = OrderedDict()
+                t = t[node]
+
+    def validate(self):
+        """
+        path必须从monitor出发并且每一跳都是已有的链路，否则抛出ValueError
+        """
+        errors = []
+        monitors = set(self.monitors)
+        for p in self.paths:
+            if p[0] not in monitors:
+                errors.append("path %s does not start at a monitor" % (p,))
+            for hop in zip(p, p[1:]):
+                if hop not in self.link_set:
+                    errors.append("path %s uses unknown link %s-%s" % ((p,) + hop))
+        if errors:
+            raise ValueError("invalid topology:\n" + "\n".join(errors))
+        return self
+
+def parse(lines):
     """
-    解析result.txt文件，读入topo信息
+    一次遍历result.txt的所有行，按Monitor/Paths/Links分段解析
     """
-    import os
-    from collections import defaultdict
-    from collections import namedtuple
+    monitors, paths, links = [], [], []
+    section = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line in ('Monitor', 'Paths', 'Links'):
+            section = line
+        elif section == 'Monitor':
+            monitors.append(int(line.split()[1]) + 1)
+        elif section == 'Paths':
+            paths.append(tuple(int(p) + 1 for p in line.split(':')[1].split()))
+        elif section == 'Links':
+            x = line.split()
+            links.append((int(x[0]) + 1, int(x[1]) + 1))
+    return Topology(monitors, paths, links).validate()
 
-    links = []
-    monitors =[]
-    paths = []
-    f = open(os.path.dirname(__file__) + "/" + 'result.txt', 'r')
-    line = f.readline()
-    while line:
-        if line.find("Monitor") != -1:
-            line = f.readline()
-            while line.find("Paths"):
-                # print line
-                x = line.strip().split()
-                monitors.append(int(x[1]) + 1)
-                line = f.readline()
-            #print 'monitors:' + str(monitors)
+# {文件名: (修改时间, Topology)}
+_loaded = {}
 
-        elif line.find("Paths") != -1:
-            line = f.readline()
-            while line.find('Links'):
-                # print(line),
-                x = line.strip().split(':')
-                x1 = x[0].split('-')
-                x2 = x[1].split()
-                x2 = [int(p)+1 for p in x2]
-                # x = [int(p)+1 for p in x]
-                paths.append(tuple(x2))
-                line = f.readline()
-            #print 'paths:' + str(paths)
+def load(filename=RESULT):
+    """
+    读入topo，文件的修改时间没有变化时直接返回上次解析的结果
+    返回的Topology是共享的，不要修改
+    """
+    mtime = os.path.getmtime(filename)
+    if filename in _loaded and _loaded[filename][0] == mtime:
+        return _loaded[filename][1]
+    with open(filename, 'rb') as f:
+        topo = parse(f.read().splitlines())
+    _loaded[filename] = (mtime, topo)
+    return topo
 
-        elif line.find("Links") != -1:
-            line = f.readline()
-            while line:
-                x = line.split()
-                x = [int(p) + 1 for p in x]
-                if (x[0], x[1]) not in links and (x[1], x[0]) not in links:
-                    links.append((x[0], x[1]))
-                line = f.readline()
-            #print 'links:' + str(links)
-    f.close()
+def _copy_trie(t):
+    return OrderedDict((node, _copy_trie(child)) for node, child in t.items())
 
-    adj_path = defaultdict(lambda: defaultdict(lambda: []))
-    for p in paths:
-        if len(p) == 2:
-            adj_path[p[0]][p[1]] = adj_path[p[0]][p[1]]
-        else:
-            adj_path[p[0]][p[1]].append(p[2])
-    # for k in adj_path.keys():
-    #     for l in adj_path[k].keys():
-    #         print k,l
-    #         print adj_path[k][l]
-    #print adj_path
-    return links, monitors, paths, adj_path
+def readtopo():
+    """
+    解析result.txt文件，读入topo信息，返回 links, monitors, paths, adj_path
+    返回的是缓存的拷贝，调用者可以修改
+    """
+    topo = load()
+    return list(topo.links), list(topo.monitors), list(topo.paths), _copy_trie(topo.adj_path)
 
 if __name__ == '__main__':
     links, monitors, paths, adj_path = readtopo()
-    # readtopo()
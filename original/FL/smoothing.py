@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+对 (links × 时刻) 的测量结果做平滑，沿最后一维计算，所有link一次完成
+mean/median使用向后的窗口 x[i:i+window]，末尾不足一个窗口时用最后一个值补齐，
+输出与输入等长
+"""
+import numpy as np
+import scipy.ndimage
+import scipy.signal
+
+def _pad(x, window):
+    # 末尾补window-1个最后的值
+    return np.concatenate([x, np.repeat(x[..., -1:], window - 1, axis=-1)], axis=-1)
+
+def moving_average(x, window=200):
+    """
+    滑动平均，用累加和计算，O(n)
+    """
+    x = np.asarray(x, dtype=float)
+    c = np.cumsum(_pad(x, window), axis=-1)
+    c = np.concatenate([np.zeros(c.shape[:-1] + (1,)), c], axis=-1)
+    return (c[..., window:] - c[..., :-window])/float(window)
+
+def moving_median(x, window=200):
+    """
+    滑动中值，在补齐后的数组上用rank_filter计算，额外内存与输入同量级
+    window为偶数时取中间两个值的平均，与np.median相同；窗口内有nan时结果为nan
+    """
+    x = np.asarray(x, dtype=float)
+    n = x.shape[-1]
+    padded = _pad(x, window)
+    size = (1,) * (x.ndim - 1) + (window,)
+    # rank_filter的窗口以j为中心，从j - window//2开始，取j = i + window//2即为x[i:i+window]
+    cut = (Ellipsis, slice(window//2, window//2 + n))
+    low = scipy.ndimage.rank_filter(padded, (window - 1)//2, size=size)[cut]
+    if window % 2 == 0:
+        low = (low + scipy.ndimage.rank_filter(padded, window//2, size=size)[cut])/2.0
+    nan = np.cumsum(np.isnan(padded), axis=-1)
+    nan = np.concatenate([np.zeros(nan.shape[:-1] + (1,)), nan], axis=-1)
+    low[(nan[..., window:] - nan[..., :-window]) > 0] = np.nan
+    return low
+
+def ewma(x, window=200):
+    """
+    指数加权平均，alpha = 2/(window+1)，以第一个值为初始值
+    """
+    x = np.asarray(x, dtype=float)
+    alpha = 2.0/(window + 1)
+    zi = (1 - alpha)*x[..., :1]
+    return scipy.signal.lfilter([alpha], [1, alpha - 1], x, axis=-1, zi=zi)[0]
+
+SMOOTHERS = {
+    'mean': moving_average,
+    'median': moving_median,
+    'ewma': ewma,
+}
+
+def smooth(x, method='mean', window=200):
+    if method not in SMOOTHERS:
+        raise ValueError("unknown smoothing method %s, use one of %s" % (method, sorted(SMOOTHERS)))
+    return SMOOTHERS[method](x, window)
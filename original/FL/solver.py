@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+求解 A x = b，A为path-link矩阵(paths × links)
+b可以是一个时刻的向量，也可以是 (paths × 时刻) 的矩阵，一次求解所有时刻
+矩阵的分解只在构建solver时计算一次
+"""
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+class InverseSolver(object):
+    """
+    A为方阵且满秩，直接求逆
+    """
+    name = 'inverse'
+
+    def __init__(self, A):
+        self.A_I = np.linalg.inv(A)
+
+    def solve(self, b):
+        return self.A_I.dot(b)
+
+class PinvSolver(object):
+    """
+    A不满秩，用伪逆求最小范数的最小二乘解
+    """
+    name = 'pinv'
+
+    def __init__(self, A):
+        self.A_I = np.linalg.pinv(A)
+
+    def solve(self, b):
+        return self.A_I.dot(b)
+
+class QRSolver(object):
+    """
+    path比link多且A列满秩，用QR分解求最小二乘解
+    """
+    name = 'qr'
+
+    def __init__(self, A):
+        self.Q, self.R = np.linalg.qr(A)
+
+    def solve(self, b):
+        return scipy.linalg.solve_triangular(self.R, self.Q.T.dot(b))
+
+class SparseLUSolver(object):
+    """
+    大规模稀疏矩阵，用SuperLU分解A(方阵)或A^T A(path比link多)，分解只做一次
+    A奇异时splu抛出RuntimeError
+    """
+    name = 'splu'
+
+    def __init__(self, A):
+        paths, links = A.shape
+        if paths < links:
+            raise RuntimeError("A has fewer paths than links")
+        self.At = None
+        if paths > links:
+            self.At = A.T.tocsr()
+            A = self.At.dot(A)
+        self.lu = scipy.sparse.linalg.splu(A.tocsc())
+
+    def solve(self, b):
+        b = np.asarray(b, dtype=float)
+        if self.At is not None:
+            b = self.At.dot(b)
+        return self.lu.solve(b)
+
+class LSQRSolver(object):
+    """
+    稀疏矩阵不满秩时，用LSQR迭代求解，每个时刻单独迭代
+    """
+    name = 'lsqr'
+
+    def __init__(self, A):
+        self.A = A
+
+    def solve(self, b):
+        b = np.asarray(b, dtype=float)
+        if b.ndim == 1:
+            return scipy.sparse.linalg.lsqr(self.A, b)[0]
+        return np.column_stack([scipy.sparse.linalg.lsqr(self.A, b[:, t])[0] for t in range(b.shape[1])])
+
+# link数不超过此值时转成稠密矩阵求解，否则使用稀疏分解
+DENSE_LINKS = 500
+
+_solvers = {}
+
+def _new_solver(A):
+    paths, links = A.shape
+    if links > DENSE_LINKS:
+        try:
+            return SparseLUSolver(A)
+        except RuntimeError:
+            return LSQRSolver(A)
+    A = A.toarray()
+    rank = np.linalg.matrix_rank(A)
+    if paths == links == rank:
+        return InverseSolver(A)
+    elif rank == links:
+        return QRSolver(A)
+    return PinvSolver(A)
+
+def make_solver(A):
+    """
+    根据A的形状和秩选择solver，同一个A只构建一次
+    A可以是稠密矩阵或scipy稀疏矩阵
+    """
+    A = scipy.sparse.csr_matrix(A, dtype=float)
+    A.sum_duplicates()
+    key = (A.shape, A.indptr.tostring(), A.indices.tostring(), A.data.tostring())
+    if key not in _solvers:
+        _solvers[key] = _new_solver(A)
+    return _solvers[key]
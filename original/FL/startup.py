@@ -26,6 +26,10 @@ def launch ():
         #配置流表
         from FL.monitoring import launch
         launch()
+
+        #跟踪probe记录，在线求解link时延和丢包
+        from FL.tomography import launch
+        launch()
 if __name__ == '__main__':
 	launch()
 	print("a")
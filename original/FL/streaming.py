@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+path-link路由矩阵和流式tomography
+不导入matplotlib，控制器中的tomography组件和离线的udphandler共用
+"""
+import os
+from collections import defaultdict
+import numpy as np
+import scipy.sparse
+
+import pathid
+
+# {path id: path}
+id_path = {}
+
+def load_id_path(filename=None):
+    # 优先读入monitoring保存的path_id.pkl，没有时读入id_path.txt
+    id_path.clear()
+    if filename is None:
+        filename = pathid.FILE if os.path.exists(pathid.FILE) else 'id_path.txt'
+    if filename.endswith('.pkl'):
+        id_path.update(pathid.load(filename))
+        return
+    f = open(filename, 'r')
+    line = f.readline()
+    line = f.readline()
+    while line:
+        line = line.split("->")
+        id_path[int(line[0])] = tuple([int(i) for i in line[1].split()])
+        line = f.readline()
+    f.close()
+
+def build_routing_matrix():
+    """
+    根据id_path构建稀疏的path-link矩阵A(CSR)，只遍历一次所有path
+    返回 link_n, path_n, A
+    """
+    link_n = defaultdict(lambda:defaultdict(lambda:None))
+    path_n = {}
+    m = 0
+    rows, cols = [], []
+    # 将path和link分别从0开始编号
+    for i in id_path.keys():
+        path_n[i] = len(path_n)
+        p = id_path[i]
+        for x in range(len(p)-1):
+            if link_n[p[x]][p[x+1]] == None or link_n[p[x+1]][p[x]] == None:
+                link_n[p[x]][p[x+1]] = link_n[p[x+1]][p[x]] = m
+                m = m + 1
+            rows.append(path_n[i])
+            cols.append(link_n[p[x]][p[x+1]])
+    # path数和link数可以不同，A不一定是方阵；重复的(path, link)会被累加
+    A = scipy.sparse.coo_matrix((np.ones(len(rows)), (rows, cols)),
+                                shape=(len(path_n), m)).tocsr()
+    return link_n, path_n, A
+
+def links_of(link_n):
+    """
+    按编号排列的link列表，与A的列一一对应
+    """
+    links = {}
+    for a in link_n.keys():
+        for b in link_n[a].keys():
+            if link_n[a][b] != None and link_n[a][b] not in links:
+                links[link_n[a][b]] = (a, b)
+    return [links[i] for i in sorted(links)]
+
+class StreamingTomography(object):
+    """
+    流式tomography：按seq顺序消费probe记录，只在环形缓冲区中保留
+    当前loss/delay窗口，内存占用与抓包时长无关。
+
+    seq在收到seq + reorder之后的记录时才会结算，用于容忍不同path之间的乱序，
+    晚于此到达的记录计入late。
+    从start_seq开始结算满loss_window_size个seq之前link_loss为None。
+    """
+    def __init__(self, path_n, solver, loss_window_size=1000, reorder=10, start_seq=0):
+        self.path_n = path_n
+        self.solver = solver
+        self.loss_window_size = loss_window_size
+        self.reorder = reorder
+        # 环形缓冲区覆盖 [next_seq - loss_window_size, next_seq + reorder]
+        self.ring_size = loss_window_size + reorder + 1
+        self.spec = 0
+        self.late = 0
+        self.reset(start_seq)
+
+    def reset(self, start_seq=0):
+        """
+        清空所有窗口，从start_seq开始重新结算
+        """
+        n = len(self.path_n)
+        self.recived = np.zeros((n, self.ring_size), dtype=np.uint8)
+        self.delay = np.zeros((n, self.ring_size))
+        # 当前loss窗口内每条path收到的probe数
+        self.count = np.zeros(n)
+        # 每条path最近一次收到的时延，用于填补丢失的probe
+        self.last_delay = np.empty(n)
+        self.last_delay.fill(np.nan)
+        self.start_seq = self.next_seq = start_seq
+
+    def push(self, path_id, seq, send_time, recive_time):
+        """
+        加入一条记录，返回因此结算的 (seq, link_delay, link_loss) 列表
+        """
+        if path_id not in self.path_n:
+            self.spec = (recive_time - send_time)*1000
+            return []
+        if seq < self.next_seq:
+            self.late += 1
+            return []
+        ans = []
+        while seq - self.next_seq > self.reorder:
+            ans.append(self._settle())
+        p, slot = self.path_n[path_id], seq % self.ring_size
+        self.recived[p, slot] = 1
+        self.delay[p, slot] = (recive_time - send_time)*1000 - self.spec
+        return ans
+
+    def flush(self):
+        """
+        结算缓冲区中剩余的seq
+        """
+        ans = []
+        last = self.next_seq + self.reorder
+        while self.next_seq <= last:
+            ans.append(self._settle())
+        return ans
+
+    def _settle(self):
+        seq = self.next_seq
+        slot = seq % self.ring_size
+        got = self.recived[:, slot] == 1
+        self.last_delay[got] = self.delay[got, slot]
+        self.count += self.recived[:, slot]
+        # 移出窗口的seq，同时清空该槽位留给 seq + reorder + 1
+        old = (seq - self.loss_window_size) % self.ring_size
+        if seq - self.start_seq >= self.loss_window_size:
+            self.count -= self.recived[:, old]
+        self.recived[:, old] = 0
+        self.next_seq += 1
+
+        link_delay = self.solver.solve(self.last_delay)
+        link_loss = None
+        if seq - self.start_seq + 1 >= self.loss_window_size:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                loss_path = np.log(self.count/self.loss_window_size)
+                # 指数还原之前取的对数
+                link_loss = (1 - np.exp(self.solver.solve(loss_path)))*100
+        return seq, link_delay, link_loss
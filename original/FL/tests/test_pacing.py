@@ -0,0 +1,31 @@
+#!/usr/bin/env python2
+#-*- coding: utf-8 -*-
+
+"""
+pacing的测试，在original/FL目录下运行: python2 -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pacing
+
+class PacerTest(unittest.TestCase):
+    def test_report_after_partial_run(self):
+        # 中途break时生成器没有结束，report仍然可用
+        pacer = pacing.Pacer(pacing.constant(10, interval=0.001))
+        for i in pacer:
+            if i == 4:
+                break
+        self.assertEqual(pacer.n, 5)
+        self.assertGreaterEqual(pacer.elapsed, 0.004)
+        self.assertIn("sent 5 probes", pacer.report())
+
+    def test_report_before_run(self):
+        pacer = pacing.Pacer(pacing.constant(1))
+        self.assertEqual(pacer.elapsed, 0.0)
+        self.assertEqual(pacer.report(), "sent 0 probes")
+
+if __name__ == '__main__':
+    unittest.main()
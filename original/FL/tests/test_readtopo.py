@@ -0,0 +1,50 @@
+#!/usr/bin/env python2
+#-*- coding: utf-8 -*-
+
+"""
+readtopo的测试，在original/FL目录下运行: python2 -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import readtopo
+
+class LoadTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.result = os.path.join(self.dir, 'result.txt')
+        shutil.copy(readtopo.RESULT, self.result)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cache_by_mtime(self):
+        topo = readtopo.load(self.result)
+        self.assertIs(readtopo.load(self.result), topo)
+        # 修改时间变化后重新解析
+        with open(self.result, 'a') as f:
+            f.write('0 1\n')
+        st = os.stat(self.result)
+        os.utime(self.result, (st.st_atime, st.st_mtime + 10))
+        reloaded = readtopo.load(self.result)
+        self.assertIsNot(reloaded, topo)
+        self.assertEqual(reloaded.links, topo.links + [(1, 2)])
+        self.assertFalse(os.path.exists(self.result + '.topo'))
+
+    def test_readtopo_returns_copies(self):
+        links, monitors, paths, adj_path = readtopo.readtopo()
+        links.append((0, 0))
+        paths.pop()
+        adj_path[monitors[0]].clear()
+        monitors.pop()
+        with open(readtopo.RESULT) as f:
+            topo = readtopo.parse(f)
+        self.assertEqual(readtopo.readtopo(),
+                         (topo.links, topo.monitors, topo.paths, topo.adj_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python2
+#-*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import smoothing
+
+def naive_median(x, window):
+    # 逐个位置对 x[i:i+window] 求中值，末尾用最后一个值补齐
+    x = np.asarray(x, dtype=float)
+    padded = np.concatenate([x, np.repeat(x[..., -1:], window - 1, axis=-1)], axis=-1)
+    return np.stack([np.median(padded[..., i:i+window], axis=-1) for i in range(x.shape[-1])], axis=-1)
+
+class MovingMedianTest(unittest.TestCase):
+
+    def test_matches_naive_loop(self):
+        rng = np.random.RandomState(0)
+        x = rng.rand(4, 700)
+        for window in (1, 2, 5, 200, 201):
+            self.assertTrue(np.allclose(smoothing.moving_median(x, window), naive_median(x, window)))
+        self.assertTrue(np.allclose(smoothing.moving_median(x[0], 7), naive_median(x[0], 7)))
+
+    def test_nan_window(self):
+        x = np.arange(50, dtype=float)
+        x[20] = np.nan
+        ans = smoothing.moving_median(x, 5)
+        self.assertTrue(np.isnan(ans[16:21]).all())
+        self.assertFalse(np.isnan(ans[:16]).any() or np.isnan(ans[21:]).any())
+        self.assertEqual(len(ans), len(x))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python2
+#-*- coding: utf-8 -*-
+
+"""
+udphandler的测试，在original/FL目录下运行: python2 -m unittest discover -s tests
+"""
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streaming
+import udphandler
+import udprecord
+from solver import make_solver
+
+# 3条path，3条link: 24-1 1-2 2-3，A为下三角矩阵
+ID_PATH = {
+    101: (24, 1),
+    102: (24, 1, 2),
+    103: (24, 1, 2, 3),
+}
+LINK_DELAY = {(24, 1): 2.0, (1, 2): 3.0, (2, 3): 5.0}
+
+def write_capture(filename, n, lost=(), start=0):
+    """
+    seq从start开始，每个seq先写一条spec记录(时延1ms)，再写每条path的记录
+    lost中的(path_id, seq)不写入
+    """
+    w = udprecord.RecordWriter(filename)
+    for seq in range(start, start + n):
+        send = 1000.0 + seq*0.002
+        w.write(9999, seq, send, send + 0.001)
+        for path_id, p in ID_PATH.items():
+            if (path_id, seq) in lost:
+                continue
+            delay = 1.0 + sum(LINK_DELAY[l] for l in zip(p, p[1:]))
+            w.write(path_id, seq, send, send + delay/1000.0)
+    w.close()
+
+def old_loss_windows(recived, max_seq, loss_window_size):
+    # 原来逐个窗口计算的实现
+    ans = []
+    for i in range(max_seq - loss_window_size):
+        i = i + loss_window_size
+        ans.append([recived[p, :i+1].sum() - recived[p, :i-loss_window_size+1].sum()
+                    for p in range(len(recived))])
+    return np.array(ans).T
+
+def old_delay_at(delay_path_list, max_seq):
+    # 原来逐个时刻向前查找最近一次收到的时延的实现
+    ans = np.empty((len(delay_path_list), max_seq))
+    for p in range(len(delay_path_list)):
+        for i in range(max_seq):
+            k = i + 10
+            while k >= 0 and (k > max_seq or np.isnan(delay_path_list[p, k])):
+                k = k - 1
+            ans[p, i] = delay_path_list[p, k] if k >= 0 else np.nan
+    return ans
+
+class HandleDelayReciveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        os.mkdir('command')
+        udphandler.id_path.clear()
+        udphandler.id_path.update(ID_PATH)
+        self.capture = os.path.join(self.tmp, 'syn' + udprecord.SUFFIX)
+        write_capture(self.capture, 1500)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+        udphandler.id_path.clear()
+
+    def read_ans(self):
+        with open(self.capture + '.ans/ans.txt') as f:
+            return f.read()
+
+    def test_without_theory(self):
+        link_delay, link_loss = udphandler.handle_delay_recive(self.capture)
+        self.assertEqual(sorted(link_delay), sorted(LINK_DELAY))
+        for k, d in LINK_DELAY.items():
+            self.assertTrue(np.allclose(link_delay[k], d))
+            self.assertTrue(np.allclose(link_loss[k], 0))
+            self.assertTrue(os.path.exists(self.capture + '.ans/delay_%s_%s.csv' % k))
+        self.assertIn('no theory value', self.read_ans())
+
+    def test_stale_theory(self):
+        Link = udphandler.Link
+        with open('command/data.pkl', 'w') as f:
+            pickle.dump({(7, 21): Link(delay=5, loss=1, delay_list=[5, 5], loss_list=[1, 1])}, f)
+        udphandler.handle_delay_recive(self.capture)
+        self.assertEqual(self.read_ans().count('no theory value'), len(LINK_DELAY))
+
+    def test_empty_capture(self):
+        open(self.capture, 'wb').close()
+        self.assertIsNone(udphandler.handle_delay_recive(self.capture))
+        recive = os.path.join(self.tmp, 'syn.recive')
+        open(recive, 'w').close()
+        self.assertIsNone(udphandler.handle_delay_recive(recive))
+
+    def test_matching_theory(self):
+        Link = udphandler.Link
+        data = dict((k, Link(delay=d, loss=1, delay_list=[d, d], loss_list=[1, 1]))
+                    for k, d in LINK_DELAY.items())
+        with open('command/data.pkl', 'w') as f:
+            pickle.dump(data, f)
+        udphandler.handle_delay_recive(self.capture)
+        ans = self.read_ans()
+        self.assertEqual(ans.count('delay_error:0.0000'), len(LINK_DELAY))
+
+class CaptureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.capture = os.path.join(self.tmp, 'syn' + udprecord.SUFFIX)
+        self.path_n = dict((path_id, i) for i, path_id in enumerate(sorted(ID_PATH)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_loss_windows_match_loop(self):
+        rng = np.random.RandomState(1)
+        lost = set((path_id, seq) for path_id in ID_PATH for seq in range(1300) if rng.rand() < 0.05)
+        write_capture(self.capture, 1300, lost)
+        recived, delay_path_list, max_seq = udphandler.load_capture(self.capture, self.path_n)
+        window = udphandler.loss_windows(recived, max_seq, 1000)
+        self.assertTrue(np.array_equal(window, old_loss_windows(recived, max_seq, 1000)))
+
+    def test_fill_forward_gaps(self):
+        # 开头、中间和结尾缺失
+        lost = set([(101, 0), (101, 1), (102, 50), (102, 51), (102, 52), (103, 98), (103, 99)])
+        write_capture(self.capture, 100, lost)
+        recived, delay_path_list, max_seq = udphandler.load_capture(self.capture, self.path_n)
+        filled = udphandler.fill_forward(delay_path_list)
+        self.assertTrue(np.isnan(filled[0, :2]).all())
+        self.assertTrue(np.allclose(filled[1, 50:53], filled[1, 49]))
+        self.assertTrue(np.allclose(filled[2, 98:], filled[2, 97]))
+        ans = udphandler.delay_at(delay_path_list, max_seq)
+        expected = old_delay_at(delay_path_list, max_seq)
+        self.assertTrue(np.array_equal(np.isnan(ans), np.isnan(expected)))
+        self.assertTrue(np.array_equal(ans[~np.isnan(ans)], expected[~np.isnan(expected)]))
+
+    def test_empty_capture(self):
+        # 接收端还没有写入任何记录
+        open(self.capture, 'wb').close()
+        r = udprecord.load_records(self.capture)
+        self.assertEqual(len(r), 0)
+        self.assertEqual(r.dtype, udprecord.RECORD)
+        self.assertEqual(list(udphandler.read_records(self.capture)), [])
+
+class StreamingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.capture = os.path.join(self.tmp, 'syn' + udprecord.SUFFIX)
+        streaming.id_path.clear()
+        streaming.id_path.update(ID_PATH)
+        self.link_n, self.path_n, A = streaming.build_routing_matrix()
+        self.links = streaming.links_of(self.link_n)
+        self.engine = streaming.StreamingTomography(self.path_n, make_solver(A), loss_window_size=200)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        streaming.id_path.clear()
+
+    def push_all(self):
+        ans = []
+        for record in udphandler.read_records(self.capture):
+            ans += self.engine.push(*record)
+        return ans + self.engine.flush()
+
+    def test_start_partway(self):
+        # 控制器在流表生效后才开始收到probe，第一个seq不为0
+        write_capture(self.capture, 500, start=1500)
+        self.engine.reset(1500)
+        ans = self.push_all()
+        self.assertEqual(ans[0][0], 1500)
+        for seq, link_delay, link_loss in ans:
+            self.assertTrue(np.allclose(link_delay, [LINK_DELAY[k] for k in self.links]))
+            if seq - 1500 + 1 < 200:
+                self.assertIsNone(link_loss)
+            else:
+                self.assertTrue(np.allclose(link_loss, 0), (seq, link_loss))
+
+    def test_loss_matches_batch(self):
+        # 流式的loss窗口和handle_delay_recive一次求解的结果相同
+        rng = np.random.RandomState(2)
+        lost = set((path_id, seq) for path_id in ID_PATH for seq in range(1300) if rng.rand() < 0.05)
+        write_capture(self.capture, 1300, lost)
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            link_delay, link_loss = udphandler.handle_delay_recive(self.capture)
+        finally:
+            os.chdir(cwd)
+        A = streaming.build_routing_matrix()[2]
+        self.engine = streaming.StreamingTomography(self.path_n, make_solver(A), loss_window_size=1000)
+        ans = self.push_all()
+        checked = 0
+        for seq, d, loss in ans:
+            # 批量结果的第c列是以seq c+1000结尾的窗口
+            c = seq - 1000
+            if loss is None or c < 0 or c >= len(link_loss[self.links[0]]):
+                continue
+            for k in self.links:
+                self.assertAlmostEqual(loss[self.link_n[k[0]][k[1]]], link_loss[k][c])
+            checked += 1
+        self.assertEqual(checked, 299)
+
+    def test_reorder_and_late(self):
+        # reorder范围内乱序到达的probe正常结算，结算之后才到达的计入late
+        records = []
+        for seq in range(40):
+            for path_id, p in ID_PATH.items():
+                delay = sum(LINK_DELAY[l] for l in zip(p, p[1:]))
+                records.append((path_id, seq, 0.0, delay/1000.0))
+        # 101在seq 20的probe晚5个seq到达(reorder=10以内)，102在seq 5的probe在seq 30之后才到达
+        shuffled = [r for r in records if r[:2] not in ((101, 20), (102, 5))]
+        shuffled.insert(shuffled.index((101, 25, 0.0, 0.002)) + 1, (101, 20, 0.0, 0.002))
+        shuffled.insert(shuffled.index((103, 30, 0.0, 0.010)) + 1, (102, 5, 0.0, 0.005))
+        ans = []
+        for r in shuffled:
+            ans += self.engine.push(*r)
+        ans += self.engine.flush()
+        self.assertEqual(self.engine.late, 1)
+        self.assertEqual([a[0] for a in ans], range(40))
+        for seq, link_delay, link_loss in ans:
+            self.assertTrue(np.allclose(link_delay, [LINK_DELAY[k] for k in self.links]))
+        # seq 5的probe没有计入，窗口内102少一个
+        self.assertEqual(self.engine.count[self.path_n[102]], 39)
+        self.assertEqual(self.engine.count[self.path_n[101]], 40)
+
+    def test_handle_delay_stream(self):
+        write_capture(self.capture, 1300, set([(103, 50)]))
+        udphandler.handle_delay_stream(self.capture)
+        with open(self.capture + '.ans/stream_delay.csv') as f:
+            delay = [l.strip().split(',') for l in f]
+        with open(self.capture + '.ans/stream_loss.csv') as f:
+            loss = [l.strip().split(',') for l in f]
+        header = ['seq'] + ['%s-%s' % k for k in self.links]
+        self.assertEqual(delay[0], header)
+        self.assertEqual(loss[0], header)
+        self.assertEqual([int(r[0]) for r in delay[1:]], range(0, 1300, 100))
+        # loss窗口为1000，seq 999之后才输出
+        self.assertEqual([int(r[0]) for r in loss[1:]], [1000, 1100, 1200])
+        for row in delay[1:]:
+            self.assertTrue(np.allclose([float(v) for v in row[1:]], [LINK_DELAY[k] for k in self.links]))
+        # seq 1000的窗口[1, 1000]包含丢失的seq 50，只有2-3丢包0.1%，之后的窗口不再包含
+        expected = dict((k, 0.0) for k in self.links)
+        expected[(2, 3)] = 0.1
+        self.assertTrue(np.allclose([float(v) for v in loss[1][1:]], [expected[k] for k in self.links]))
+        for row in loss[2:]:
+            self.assertTrue(np.allclose([float(v) for v in row[1:]], 0))
+
+if __name__ == '__main__':
+    unittest.main()
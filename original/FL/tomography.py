@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+在控制器中在线求解link时延和丢包
+跟踪udpreceiver写入的.rec文件，新的probe记录到达后立即送入StreamingTomography，
+每window个seq发布一次LinkEstimate事件
+求解在后台线程中进行，recoco的Timer只负责读文件和发布事件
+path_id.pkl(或id_path.txt)更新后重新建立路由矩阵
+"""
+
+from pox.core import core
+from pox.lib.revent import *
+from pox.lib.recoco import Timer
+import glob
+import os
+import threading
+import Queue
+import time
+import numpy as np
+
+import pathid
+import streaming
+import udprecord
+from solver import make_solver
+
+log = core.getLogger()
+
+class LinkEstimate(Event):
+    """
+    一个窗口的测量结果，delay(ms)和loss(%)均为 {link: value}
+    第一个loss窗口填满之前loss为None
+    """
+    def __init__(self, seq, delay, loss):
+        Event.__init__(self)
+        self.seq = seq
+        self.delay = delay
+        self.loss = loss
+
+class Solver(threading.Thread):
+    """
+    后台求解线程：inbox中为 ('topo', None) 或 ('records', 记录数组)，
+    结算的窗口以 (seq, delay, loss) 放入outbox
+    """
+    def __init__(self, window):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.window = window
+        self.inbox = Queue.Queue()
+        self.outbox = Queue.Queue()
+        self.engine = None
+        self.start()
+
+    def _load_topo(self):
+        streaming.load_id_path()
+        link_n, path_n, A = streaming.build_routing_matrix()
+        solver = make_solver(A)
+        self.links = streaming.links_of(link_n)
+        self.engine = streaming.StreamingTomography(path_n, solver)
+        # 新的路由矩阵从下一条记录的seq开始结算
+        self.first = True
+        log.debug("tomography: %d paths, %d links, solver %s", A.shape[0], A.shape[1], solver.name)
+
+    def _push(self, records):
+        if self.engine is None:
+            return
+        for r in records:
+            if self.first and int(r['path']) in self.engine.path_n:
+                self.engine.reset(int(r['seq']))
+                self.first = False
+            for seq, link_delay, link_loss in self.engine.push(int(r['path']), int(r['seq']), float(r['send']), float(r['recv'])):
+                if seq % self.window == 0:
+                    self.outbox.put((seq, dict(zip(self.links, link_delay)),
+                                     None if link_loss is None else dict(zip(self.links, link_loss))))
+
+    def run(self):
+        while True:
+            kind, data = self.inbox.get()
+            if kind is None:
+                break
+            try:
+                if kind == 'topo':
+                    self._load_topo()
+                else:
+                    self._push(data)
+            except Exception:
+                log.exception("tomography solver failed")
+
+    def close(self):
+        self.inbox.put((None, None))
+        self.join()
+
+class Tomography(EventMixin):
+    _core_name = "fl_tomography"
+    _eventMixin_events = set([
+                            LinkEstimate,
+                            ])
+
+    def __init__(self, recive=None, interval=1.0, window=500):
+        log.debug("Tomography coming up")
+        self.recive = recive
+        self.started = time.time()
+        self.topo_mtime = None
+        self.f = None
+        self.solver = Solver(window)
+        Timer(interval, self._poll, recurring=True)
+        core.addListenerByName("GoingDownEvent", lambda event: self.solver.close())
+
+    def _check_topo(self):
+        """
+        monitoring安装完流表后才会写入path_id.pkl或id_path.txt，
+        文件的修改时间变化时(重新下发了监测流表)重新建立路由矩阵
+        """
+        filename = pathid.FILE if os.path.exists(pathid.FILE) else 'id_path.txt'
+        if not os.path.exists(filename):
+            return False
+        mtime = os.path.getmtime(filename)
+        if mtime < self.started:
+            return False
+        if mtime != self.topo_mtime:
+            if self.topo_mtime is not None:
+                log.info("%s changed, reloading tomography", filename)
+            self.topo_mtime = mtime
+            self.solver.inbox.put(('topo', None))
+        return True
+
+    def _open(self):
+        """
+        打开指定的.rec文件，未指定时使用本次启动后最新的.rec文件
+        """
+        filename = self.recive
+        if filename is None:
+            recs = [r for r in glob.glob('*' + udprecord.SUFFIX) if os.path.getmtime(r) >= self.started]
+            if not recs:
+                return False
+            filename = max(recs, key=os.path.getmtime)
+        elif not os.path.exists(filename):
+            return False
+        self.f = open(filename, 'rb')
+        log.debug("tomography reading %s", filename)
+        return True
+
+    def _poll(self):
+        # 先发布后台线程已经算好的结果
+        while True:
+            try:
+                seq, delay, loss = self.solver.outbox.get_nowait()
+            except Queue.Empty:
+                break
+            self._publish(seq, delay, loss)
+        if not self._check_topo():
+            return
+        if self.f is None and not self._open():
+            return
+        data = self.f.read()
+        # 只处理完整的记录，不完整的部分留到下一次
+        n = len(data) // udprecord.RECORD.itemsize * udprecord.RECORD.itemsize
+        self.f.seek(n - len(data), os.SEEK_CUR)
+        if n:
+            self.solver.inbox.put(('records', np.frombuffer(data[:n], dtype=udprecord.RECORD)))
+
+    def _publish(self, seq, delay, loss):
+        k = max(delay, key=delay.get)
+        log.debug("seq %s: max delay %.3fms at %s-%s", seq, delay[k], k[0], k[1])
+        self.raiseEvent(LinkEstimate(seq, delay, loss))
+
+def launch(recive=None, interval=1.0, window=500):
+    # 注册Tomography组件
+    core.registerNew(Tomography, recive, float(interval), int(window))
@@ -4,113 +4,139 @@
 import matplotlib  
 matplotlib.use('Agg')  
 from time import sleep
-from math import log, e
 import matplotlib.pyplot as plt
-import readtopo
+import udprecord
+from solver import make_solver
+from smoothing import smooth
+from streaming import id_path, build_routing_matrix, links_of, load_id_path, StreamingTomography
 import numpy as np
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 import pickle
 from matplotlib.pyplot import savefig 
 
 Link = namedtuple("Link", "delay loss delay_list loss_list")
 import os
+import sys
 
-id_path = {}
-def handle_delay_recive():
-    link_n = defaultdict(lambda:defaultdict(lambda:None))
-    n = -1
-    # 将link从0-->n编号
-    for i in id_path.keys():
-        p = id_path[i]
-        for x in range(len(p)-1):
-            if link_n[p[x]][p[x+1]] == None or link_n[p[x+1]][p[x]] == None:
-                n = n + 1
-                link_n[p[x]][p[x+1]] = link_n[p[x+1]][p[x]] = n
-    path_n = {}
-    n = -1 
-    # 将path从0-->n编号
-    for i in id_path.keys():
-        n = n + 1
-        path_n[i] = n
-    import numpy as np
-    A = np.matrix([[0.0]*(n+1),]*(n+1))
-    # print A
-    #根据path构建矩阵
-    # print path_n
-    for i in id_path.keys():
-        path = id_path[i]
-        for j in range(len(path)-1):
-            A[path_n[i], link_n[path[j]][path[j+1]]] += 1
-
-    #保存矩阵的逆
-    A_I = A.I
-    delay_path_list = defaultdict(lambda:defaultdict(lambda:None))
-
-    delay_path = np.matrix([0.0]*(n+1)).reshape(-1,1)
-    loss_path = np.matrix([0.0]*(n+1)).reshape(-1,1)
-
-    loss = defaultdict(lambda:defaultdict(lambda:0.0))
-    filename = '2017_02_16_17:21:02.recive'
+def parse(line):
+    """
+    解析udpreceiver写入的一行: (addr, data, recvtime)
+    返回 path_id(udp源端口), seq, send_time, recive_time
+    """
+    line = line[1:-2].replace('(', ',').replace(')', ',').replace('\'', ',').split(',')
+    return int(line[4]), int(line[8]), float(line[9]), float(line[12]),
+
+def read_records(filename):
+    """
+    逐条读取probe记录，不在内存中保存整个文件
+    .rec为udprecord的二进制格式，其余按.recive文本格式逐行解析
+    """
+    if filename.endswith(udprecord.SUFFIX):
+        for r in udprecord.load_records(filename):
+            yield int(r['path']), int(r['seq']), float(r['send']), float(r['recv'])
+        return
     with open(filename, 'r') as f:
-        line = f.readline()
-        spec = 0
-        max_seq = 0;
-        def parse(line):
-            line = line[1:-2].replace('(', ',').replace(')', ',').replace('\'', ',').split(',')
-            return int(line[4]), int(line[8]), float(line[9]), float(line[12]), 
-        while line:
-            path_id, seq, send_time, recive_time = parse(line)
-            if path_id in path_n.keys():
-                delay_path_list[path_n[path_id]][seq] = (recive_time - send_time)*1000 - spec
-                loss[path_n[path_id]][seq] = 1
-            else:
-                spec = (recive_time - send_time)*1000
-            if seq > max_seq:
-                max_seq = seq
-            line = f.readline()
-
-    for i in range(max_seq):
-        for path_id in path_n.keys():
-            loss[path_n[path_id]][i] += loss[path_n[path_id]][i-1]
-    
-    monitors, SDN_node, paths, links = readtopo.readtopo()
+        for line in f:
+            yield parse(line)
+
+def load_capture(filename, path_n):
+    """
+    读入整个抓包文件，返回 (paths × seq) 的接收标记矩阵和时延矩阵(未收到为nan)
+    文件中没有记录时返回None
+    """
+    if filename.endswith(udprecord.SUFFIX):
+        r = udprecord.load_records(filename)
+        port, seq, send, recv = r['path'], r['seq'].astype(np.int64), r['send'], r['recv']
+    else:
+        records = list(read_records(filename))
+        if not records:
+            return None
+        port, seq, send, recv = [np.array(c) for c in zip(*records)]
+    if len(seq) == 0:
+        return None
+    delay = (recv - send)*1000
+    # udp源端口 --> path编号，不属于测量路径的probe为-1
+    row_of = np.empty(1 << 16, dtype=np.int64)
+    row_of.fill(-1)
+    for path_id in path_n.keys():
+        row_of[path_id] = path_n[path_id]
+    row = row_of[port]
+    # 每条记录减去它之前最近一次的时延偏移spec
+    is_spec = row < 0
+    last = np.maximum.accumulate(np.where(is_spec, np.arange(len(row)), -1))
+    spec = np.where(last >= 0, delay[last], 0)
+
+    max_seq = int(seq.max())
+    ok = ~is_spec
+    recived = np.zeros((len(path_n), max_seq + 1))
+    recived[row[ok], seq[ok]] = 1
+    delay_path_list = np.empty((len(path_n), max_seq + 1))
+    delay_path_list.fill(np.nan)
+    delay_path_list[row[ok], seq[ok]] = delay[ok] - spec[ok]
+    return recived, delay_path_list, max_seq
+
+def fill_forward(delay_path_list):
+    """
+    用每条path之前最近一次收到的时延填补丢失的probe，之前从未收到过的仍为nan
+    """
+    valid = ~np.isnan(delay_path_list)
+    k = np.where(valid, np.arange(delay_path_list.shape[1]), -1)
+    k = np.maximum.accumulate(k, axis=1)
+    ans = delay_path_list[np.arange(len(delay_path_list))[:, None], k]
+    ans[k < 0] = np.nan
+    return ans
+
+def delay_at(delay_path_list, max_seq, lead=10):
+    """
+    第i个时刻使用每条path在seq i+lead之前(包括i+lead)最近一次收到的时延，返回 (paths × max_seq)
+    """
+    return fill_forward(delay_path_list)[:, np.minimum(np.arange(max_seq) + lead, max_seq)]
+
+def loss_windows(recived, max_seq, loss_window_size):
+    """
+    窗口(i-loss_window_size, i]内每条path收到的probe数，每列为一个窗口，
+    第c列以seq c+loss_window_size结尾
+    """
+    loss = np.cumsum(recived[:, :max_seq], axis=1)
+    return loss[:, loss_window_size:] - loss[:, :-loss_window_size]
+
+def handle_delay_recive(filename, smooth_method='mean', smooth_window=200):
+    link_n, path_n, A = build_routing_matrix()
+
+    # 矩阵分解只做一次，所有窗口共用
+    solver = make_solver(A)
+    print "%d paths, %d links, solver: %s" % (A.shape[0], A.shape[1], solver.name)
+
+    capture = load_capture(filename, path_n)
+    if capture is None:
+        print "no probe records in %s" % filename
+        return
+    recived, delay_path_list, max_seq = capture
+    links = links_of(link_n)
 
     loss_window_size = 1000
     loss_window_size2 = 100
     delay_window_size = 500*10
-    link_loss = defaultdict(lambda:[])
-    for i in range(max_seq - loss_window_size):
-        i = i + loss_window_size
-        for path_id in path_n.keys():
-            try:
-                loss_path[path_n[path_id]] = log((loss[path_n[path_id]][i] -loss[path_n[path_id]][i-loss_window_size])/(loss_window_size))
-            except ValueError, error:
-                print loss[path_n[path_id]][i], loss[path_n[path_id]][i-loss_window_size]
-                return
-
-        # # 求解link_loss
-        link_loss_temp = A_I*loss_path
-        for g in path_n.keys():
-            # 指数还原之前取的对数
-            link_loss_temp[path_n[g],0] = (1 - e**link_loss_temp[path_n[g],0])*100
-
-        for k in links:
-            link_loss[k].append(link_loss_temp[link_n[k[0]][k[1]],0])
-
-    link_delay = defaultdict(lambda:[])
-
-    for i in range(max_seq):
-        i += 10
-        for path_id in path_n.keys():
-            k = i;
-            while delay_path_list[path_n[path_id]][k] == None and k >=  0:
-                k = k -1;
-            delay_path[path_n[path_id]] = delay_path_list[path_n[path_id]][k]
-            # print delay_path[path_n[path_id]]
-        # 求解时延
-        a = A_I*delay_path
-        for k in links:
-            link_delay[k].append(a[link_n[k[0]][k[1]],0])
+
+    window = loss_windows(recived, max_seq, loss_window_size)
+    if (window == 0).any():
+        p, i = np.argwhere(window == 0)[0]
+        print "path %s lost every probe in window %s" % (p, i)
+        return
+    loss_path = np.log(window/float(loss_window_size))
+
+    # 一次求解所有窗口的link_loss，并指数还原之前取的对数
+    link_loss_all = (1 - np.exp(solver.solve(loss_path)))*100
+    link_loss = {}
+    for k in links:
+        link_loss[k] = link_loss_all[link_n[k[0]][k[1]]]
+
+    # 一次求解所有时刻
+    delay_path = delay_at(delay_path_list, max_seq)
+    link_delay_all = smooth(solver.solve(delay_path), smooth_method, smooth_window)
+    link_delay = {}
+    for k in links:
+        link_delay[k] = link_delay_all[link_n[k[0]][k[1]]]
 
     offset = 0
     try:
@@ -118,94 +144,114 @@ def handle_delay_recive():
     except :
         pass
 
+    # command/data.pkl为仿真设置的理论值，没有或者与当前topo不符的link只输出测量值
+    data = load_theory("command/data.pkl")
+
     ans_file = open(filename+".ans"+"/ans.txt", "w")
-    with open("command/data.pkl", "r") as f:
-        data = pickle.load(f)
-        sub_i = 1;
-        x = [i/500.0 for i in range(len(link_delay[k]))]
-        def conv(link_delay_k):
-            temp1 = temp2 = link_delay_k[0]
-            link_delay_k[0] = sum(link_delay_k[:200])
-            for i in range(len(link_delay_k)-200):
-                i = i + 1
-                temp1 = link_delay_k[i]
-                link_delay_k[i] = link_delay_k[i-1] + link_delay_k[i+199] - temp2
-                temp2 = temp1
-            link_delay_k = [link_delay_k[i]/200.0 for i in range(len(link_delay_k))]
-            return link_delay_k
-        for k in link_delay:
-            # k = link_delay.keys()[2]
-            # plt.subplot(int("%s%s%s"%(len(link_delay.keys())/2+1, 2, sub_i)))
-            sub_i = sub_i+1
-            link_delay[k] = conv(link_delay[k])
-            # plt.plot(x[:len(link_delay[k])], link_delay[k], 'r', label = "measure %s-%s"%(k[0], k[1]))
-            ans = [data[k].delay_list[i/(delay_window_size/loss_window_size2)] for i in range(len(link_delay[k])/loss_window_size2)]
-            ans += [ans[-1] for i in range(15)]
-            ans = ans[15:]
-            # plt.plot(x[:len(ans)], ans, 'b', label = "theory %s-%s"%(k[0], k[1]))
-            # plt.legend(fontsize = 10)
-            # plt.ylim(0, 40)
-            # plt.xlabel("time:second")
-            # plt.ylabel("delay:ms")
-            # plt.title("delay measure")
-            # # break;
-            # savefig(filename+".ans"+"/%s delay %s-%s.svg"%(filename, k[0], k[1]))
-            # plt.clf()
-            with open(filename+".ans"+"/delay_%s_%s.csv"%(k[0], k[1]), "w") as w_f:
-                #for i in link_delay[k]:
-                #    w_f.write('%s\n'%i)
-                #continue
-                w_f.write("measure,theory\n")
-                for col_i in range(min(len(ans), len(link_delay[k]))):
-                    w_f.write("%s,%s\n"%(link_delay[k][col_i*loss_window_size2], ans[col_i]))
-        #return
-        x = [i*loss_window_size/50.0 for i in range(len(link_loss[k][::loss_window_size]))]
-        for k in link_loss:
-            # k = link_delay.keys()[2]
-            # plt.subplot(int("%s%s%s"%(len(link_loss.keys())/2+1, 2, sub_i)))
-            # plt.plot(x[:len(link_loss[k][::loss_window_size])], link_loss[k][::loss_window_size][:len(x)], 'r', label = "measure %s-%s"%(k[0], k[1]))
-            ans = data[k].loss_list
-            ans = [data[k].loss_list[(i*loss_window_size)/delay_window_size] for i in range(len(link_loss[k][::loss_window_size]))]
-            ans += [ans[-1] for i in range(2)]
-            ans = ans[2:]
-            # plt.plot(x[:len(ans)], ans[:len(x)], 'b', label = "theory %s-%s"%(k[0], k[1]))
-            # plt.ylim(0, 10)
-            # plt.legend(fontsize = 10)
-            # plt.xlabel("time:second")
-            # plt.ylabel("loss:%")
-            # plt.title("loss measure")
-            # # break;
-            # savefig(filename+".ans"+"/%sloss %s-%s.svg"%(filename, k[0], k[1]))
-            # plt.clf()
-            with open(filename+".ans"+"/loss_%s_%s.csv"%(k[0], k[1]), "w") as w_f:
-                w_f.write("measure,theory\n")
-                for col_i in range(min(len(link_loss[k]), len(ans))):
-                    w_f.write("%s,%s\n"%(link_loss[k][col_i*loss_window_size], ans[col_i]))
-
-
-        for k in link_delay:
+    for k in links:
+        theory = data.get(k) or data.get((k[1], k[0]))
+        n = len(link_delay[k])/loss_window_size2
+        ans = [''] * n
+        if theory is not None:
             try:
-                delay_error = [abs(link_delay[k][i] - data[k].delay_list[(i+offset)/delay_window_size])/data[k].delay_list[(i+offset)/delay_window_size] for i in range(len(link_delay[k])-offset)]
+                ans = [theory.delay_list[i/(delay_window_size/loss_window_size2)] for i in range(n)]
+                ans = (ans + [ans[-1] for i in range(15)])[15:]
             except IndexError:
-                print i, i + offset
-                print len(link_delay[k])
-                return
-            loss_error = [abs(link_loss[k][i*delay_window_size+offset] - data[k].loss_list[i])/data[k].loss_list[i] for i in range(len(data[k].loss_list)-1)]
-            print >> ans_file, k, "delay_error:%.4lf"%(sum(delay_error)/(len(link_delay[k])-offset)*100), "loss_error:%.4lf"%(100*sum(loss_error)/len(loss_error))
-        ans_file.close()
+                ans = [''] * n
+        with open(filename+".ans"+"/delay_%s_%s.csv"%(k[0], k[1]), "w") as w_f:
+            w_f.write("measure,theory\n")
+            for col_i in range(min(len(ans), len(link_delay[k]))):
+                w_f.write("%s,%s\n"%(link_delay[k][col_i*loss_window_size2], ans[col_i]))
+
+    for k in links:
+        theory = data.get(k) or data.get((k[1], k[0]))
+        n = len(link_loss[k][::loss_window_size])
+        ans = [''] * n
+        if theory is not None:
+            try:
+                ans = [theory.loss_list[(i*loss_window_size)/delay_window_size] for i in range(n)]
+                ans = (ans + [ans[-1] for i in range(2)])[2:]
+            except IndexError:
+                ans = [''] * n
+        with open(filename+".ans"+"/loss_%s_%s.csv"%(k[0], k[1]), "w") as w_f:
+            w_f.write("measure,theory\n")
+            for col_i in range(min(len(link_loss[k]), len(ans))):
+                w_f.write("%s,%s\n"%(link_loss[k][col_i*loss_window_size], ans[col_i]))
+
+    for k in links:
+        theory = data.get(k) or data.get((k[1], k[0]))
+        if theory is None:
+            print >> ans_file, k, "no theory value"
+            continue
+        try:
+            delay_error = [abs(link_delay[k][i] - theory.delay_list[(i+offset)/delay_window_size])/theory.delay_list[(i+offset)/delay_window_size] for i in range(len(link_delay[k])-offset)]
+        except IndexError:
+            print "%s: data.pkl delay_list too short for %d seq" % (k, len(link_delay[k]))
+            continue
+        loss_error = [abs(link_loss[k][i*delay_window_size+offset] - theory.loss_list[i])/theory.loss_list[i] for i in range(len(theory.loss_list)-1)]
+        loss_error = 100*sum(loss_error)/len(loss_error) if loss_error else float('nan')
+        print >> ans_file, k, "delay_error:%.4lf"%(sum(delay_error)/(len(link_delay[k])-offset)*100), "loss_error:%.4lf"%loss_error
+    ans_file.close()
+
+    return link_delay, link_loss
+
+def load_theory(filename):
+    """
+    读入仿真设置的每条link的理论时延和丢包 {link: Link}，文件不存在或无法读取时返回{}
+    """
+    try:
+        with open(filename, "r") as f:
+            return pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+        print "no theory data from %s: %s" % (filename, e)
+        return {}
+
+def handle_delay_stream(filename, emit_every=100):
+    """
+    以流式方式处理filename，每emit_every个seq输出一行各link的delay/loss估计
+    """
+    link_n, path_n, A = build_routing_matrix()
+    links = links_of(link_n)
+    engine = StreamingTomography(path_n, make_solver(A))
+    columns = [link_n[k[0]][k[1]] for k in links]
+
+    try:
+        os.mkdir(filename+".ans")
+    except :
+        pass
+    delay_f = open(filename+".ans"+"/stream_delay.csv", "w")
+    loss_f = open(filename+".ans"+"/stream_loss.csv", "w")
+    header = "seq," + ",".join(["%s-%s"%k for k in links]) + "\n"
+    delay_f.write(header)
+    loss_f.write(header)
+
+    def emit(results):
+        for seq, link_delay, link_loss in results:
+            if seq % emit_every:
+                continue
+            delay_f.write("%s,%s\n"%(seq, ",".join(["%s"%link_delay[c] for c in columns])))
+            if link_loss is not None:
+                loss_f.write("%s,%s\n"%(seq, ",".join(["%s"%link_loss[c] for c in columns])))
 
-    return
+    for record in read_records(filename):
+        emit(engine.push(*record))
+    emit(engine.flush())
+    delay_f.close()
+    loss_f.close()
+    if engine.late:
+        print "%d late probes dropped" % engine.late
 
 def main():
-    # 读入id_path.txt
-    f = open('id_path.txt', 'r')
-    line = f.readline()
-    line = f.readline()
-    while line:
-        line = line.split("->")
-        id_path[int(line[0])] = tuple([int(i) for i in line[1].split()])
-        line = f.readline()
-    f.close()
-    handle_delay_recive()
+    """
+    usage: udphandler.py [--stream] [--smooth=mean|median|ewma] [--window=200] [xxx.recive]
+    """
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    opts = dict((a[2:].split('=') + [None])[:2] for a in sys.argv[1:] if a.startswith('--'))
+    filename = args[0] if args else '2017_02_16_17:21:02.recive'
+    load_id_path()
+    if 'stream' in opts:
+        handle_delay_stream(filename)
+    else:
+        handle_delay_recive(filename, opts.get('smooth', 'mean'), int(opts.get('window', 200)))
 if __name__ == '__main__':
     main()
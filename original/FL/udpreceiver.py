@@ -1,38 +1,91 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
+"""
+接收probe，每次epoll唤醒后一次读空socket，
+接收时间使用内核时间戳，记录由后台线程写入.rec文件
+"""
 from socket import *
+import errno
+import fcntl
+import select
+import struct
 import time
 import sys
+from udprecord import BackgroundRecordWriter, parse_payload, SUFFIX
 
 HOST = '10.0.0.1'
 PORT = 10000
 BUFSIZ = 1024
 ADDR = (HOST, PORT)
+TIMEOUT = 10
+# 读取最近一个数据包的内核接收时间 struct timespec
+SIOCGSTAMPNS = 0x8907
 
 udpSerSock = socket(AF_INET, SOCK_DGRAM)
+udpSerSock.setsockopt(SOL_SOCKET, SO_RCVBUF, 4 << 20)
 udpSerSock.bind(ADDR)
+udpSerSock.setblocking(0)
 
+def kernel_time(sock):
+    """
+    最近一次recvfrom收到的数据包的内核接收时间戳
+    """
+    ts = fcntl.ioctl(sock.fileno(), SIOCGSTAMPNS, '\0' * struct.calcsize('ll'))
+    sec, nsec = struct.unpack('ll', ts)
+    return sec + nsec * 1e-9
 
+def kernel_drops(port=PORT):
+    """
+    /proc/net/udp中该端口的socket因接收缓冲区满而丢弃的数据包数
+    """
+    with open('/proc/net/udp') as f:
+        for line in f.readlines()[1:]:
+            x = line.split()
+            if int(x[1].split(':')[1], 16) == port:
+                return int(x[-1])
+    return 0
 
 def main(is_print = None):
     if not is_print:
-        udpSerSock.settimeout(10)
-        f_delay = open(r'%s.recive'%time.strftime("%Y_%m_%d_%H:%M:%S"), "w")
+        f_delay = BackgroundRecordWriter(r'%s%s'%(time.strftime("%Y_%m_%d_%H:%M:%S"), SUFFIX))
+    ep = select.epoll()
+    ep.register(udpSerSock.fileno(), select.EPOLLIN)
+    recived = malformed = 0
+    drops = kernel_drops()
     try:
         while True:
-            data, addr = udpSerSock.recvfrom(BUFSIZ)
-            recvtime = time.time()
-            if is_print:
-                print "%6s %10.4fms"%(addr[1], (recvtime - eval(data)[1])*1000)
-                continue
-            f_delay.write(repr((addr, data, recvtime))+'\n')
-            #f_delay.flush()
-    except :
-        print "There was a timeout" 
+            if not ep.poll(-1 if is_print else TIMEOUT):
+                print "There was a timeout"
+                break
+            # 一次读空socket
+            while True:
+                try:
+                    data, addr = udpSerSock.recvfrom(BUFSIZ)
+                except error, e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    raise
+                recvtime = kernel_time(udpSerSock)
+                recived += 1
+                try:
+                    seq, send_time = parse_payload(data)
+                except struct.error:
+                    malformed += 1
+                    continue
+                if is_print:
+                    print "%6s %10.4fms"%(addr[1], (recvtime - send_time)*1000)
+                    continue
+                f_delay.write(addr[1], seq, send_time, recvtime)
+    except KeyboardInterrupt:
+        pass
     finally:
+        stat = "recived %d, malformed %d, dropped by kernel %d" % (recived, malformed, kernel_drops() - drops)
         if not is_print:
             f_delay.close()
+            stat += ", dropped by writer %d" % f_delay.dropped
+        print stat
+        ep.close()
         udpSerSock.close()
 if __name__ == '__main__':
     if len(sys.argv) > 1:
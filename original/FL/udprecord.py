@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+probe payload和probe记录的二进制格式
+payload: seq(u32) 发送时间ns(u64) path(u16) sender(u16)，网络字节序
+每条记录定长: path(udp源端口) seq send_time recive_time，小端序
+文件可以直接用np.memmap映射成结构化数组，不需要逐行解析
+"""
+import os
+import struct
+import sys
+import threading
+import Queue
+import numpy as np
+
+RECORD = np.dtype([('path', '<u2'), ('seq', '<u4'), ('send', '<f8'), ('recv', '<f8')])
+SUFFIX = '.rec'
+
+PAYLOAD = struct.Struct('!IQHH')
+
+class Payload(object):
+    """
+    预分配的payload缓冲区，每次发送前原地更新，不再每个probe生成新的字符串
+    path和sender可选，默认为0；原始monitor拓扑中path由交换机写入udp源端口
+    """
+    def __init__(self, path=0, sender=0):
+        self.buf = bytearray(PAYLOAD.size)
+        self.path = path
+        self.sender = sender
+
+    def update(self, seq, send_time):
+        PAYLOAD.pack_into(self.buf, 0, seq, int(send_time*1e9), self.path, self.sender)
+        return self.buf
+
+def parse_payload(data):
+    """
+    解析udpsender发送的payload，返回 seq, send_time(秒)
+    """
+    seq, send_ns, path, sender = PAYLOAD.unpack_from(data)
+    return seq, send_ns*1e-9
+
+class RecordWriter(object):
+    """
+    先把记录写入预分配的缓冲区，满batch条后一次性写入文件
+    """
+    def __init__(self, filename, batch=4096):
+        self.f = open(filename, 'wb')
+        self.buf = np.zeros(batch, dtype=RECORD)
+        self.n = 0
+
+    def write(self, path, seq, send_time, recive_time):
+        self.buf[self.n] = (path, seq, send_time, recive_time)
+        self.n += 1
+        if self.n == len(self.buf):
+            self.flush()
+
+    def flush(self):
+        self.buf[:self.n].tofile(self.f)
+        self.f.flush()
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+class BackgroundRecordWriter(threading.Thread):
+    """
+    接收线程只把记录写入预分配的缓冲区，写满后交给后台线程写入文件
+    没有空闲缓冲区时丢弃记录并计入dropped，不阻塞接收
+    """
+    def __init__(self, filename, batch=4096, buffers=8):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.f = open(filename, 'wb')
+        self.free = Queue.Queue()
+        self.full = Queue.Queue()
+        for i in range(buffers - 1):
+            self.free.put(np.zeros(batch, dtype=RECORD))
+        self.buf = np.zeros(batch, dtype=RECORD)
+        self.n = 0
+        self.dropped = 0
+        self.start()
+
+    def write(self, path, seq, send_time, recive_time):
+        if self.buf is None:
+            try:
+                self.buf = self.free.get_nowait()
+            except Queue.Empty:
+                self.dropped += 1
+                return
+        self.buf[self.n] = (path, seq, send_time, recive_time)
+        self.n += 1
+        if self.n == len(self.buf):
+            self.full.put((self.buf, self.n))
+            self.buf, self.n = None, 0
+
+    def run(self):
+        while True:
+            buf, n = self.full.get()
+            if buf is None:
+                break
+            buf[:n].tofile(self.f)
+            self.f.flush()
+            self.free.put(buf)
+        self.f.close()
+
+    def close(self):
+        if self.buf is not None and self.n:
+            self.full.put((self.buf, self.n))
+        self.full.put((None, 0))
+        self.join()
+
+def load_records(filename):
+    """
+    将.rec文件映射为结构化数组(只读，零拷贝)
+    空文件不能memmap，返回长度为0的数组
+    """
+    if os.path.getsize(filename) == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(filename, dtype=RECORD, mode='r')
+
+def convert(filename):
+    """
+    将旧的.recive文本文件转换为.rec文件，返回新文件名
+    """
+    from udphandler import read_records
+    out = filename.rsplit('.', 1)[0] + SUFFIX
+    w = RecordWriter(out)
+    for record in read_records(filename):
+        w.write(*record)
+    w.close()
+    return out
+
+if __name__ == '__main__':
+    # usage: udprecord.py xxx.recive [yyy.recive ...]
+    for filename in sys.argv[1:]:
+        print filename, '->', convert(filename)
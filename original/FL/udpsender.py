@@ -8,6 +8,8 @@
 from socket import *
 import time
 import sys
+from pacing import Pacer, PATTERNS
+from udprecord import Payload
 
 HOST = '10.0.0.2'
 PORT = 10000
@@ -19,18 +21,23 @@ udpCliSock.bind(('10.0.0.1', 9999))
 
 internal = 0.002
 measure_time = 60
-n = int(measure_time/internal)
-# n = 2
 
-def main():
-    for i in range(n):
-        # i += 1
-        data = repr((i, time.time()))
-        udpCliSock.sendto(data, ADDR)
+def main(pattern = 'constant'):
+    """
+    pattern: constant 每internal秒一个probe; burst 每5个probe一组，组间隔0.49秒;
+    poisson 平均间隔internal
+    """
+    pacer = Pacer(PATTERNS[pattern](measure_time, internal))
+    payload = Payload()
+    for i in pacer:
+        udpCliSock.sendto(payload.update(i, time.time()), ADDR)
         if i%500==0:
             print("send %d probe packet."%i)
-        time.sleep(internal)
+    print(pacer.report())
     udpCliSock.close()
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1:
+        main(sys.argv[1])
+    else:
+        main()
@@ -15,9 +15,121 @@ import pox.openflow.libopenflow_01 as of
 import pox.lib.packet as pkt
 
 import time
+from collections import Counter
 
 log = core.getLogger()
 
+MONITOR_SRC = IPAddr('10.0.0.1')
+MONITOR_DST = IPAddr('10.0.0.2')
+
+# 按以太网类型和ip协议号分类PacketIn，(类别, 头部类型)
+ETHER_CLASS = {
+    ethernet.ARP_TYPE: ('arp', arp),
+    ethernet.IP_TYPE: ('ipv4', ipv4),
+    ethernet.LLDP_TYPE: ('lldp', None),
+    ethernet.IPV6_TYPE: ('ipv6', None),
+}
+IP_CLASS = {
+    ipv4.UDP_PROTOCOL: 'udp',
+    ipv4.TCP_PROTOCOL: 'tcp',
+    ipv4.ICMP_PROTOCOL: 'icmp',
+}
+
+def classify(packet):
+    """
+    只看一次以太网类型(跳过vlan)和ip协议号，返回 (类别, 头部, vlan)
+    类别为arp/udp/tcp/icmp/ipv4/lldp/ipv6/other，头部为arp或ipv4对象，vlan为(id, pcp)或None
+    """
+    header, eth_type, v = packet.next, packet.type, None
+    if eth_type == ethernet.VLAN_TYPE and isinstance(header, vlan):
+        v = (header.id, header.pcp)
+        header, eth_type = header.next, header.eth_type
+    kind, cls = ETHER_CLASS.get(eth_type, ('other', None))
+    if cls is not None and not isinstance(header, cls):
+        return 'other', None, v
+    if kind == 'ipv4':
+        kind = IP_CLASS.get(header.protocol, 'ipv4')
+    return kind, header, v
+
+def host_mac(ip):
+    # host 10.0.0.x的mac为00:00:00:00:00:x
+    return EthAddr('00:00:00:00:00:%s' % str(ip).split('.')[3])
+
+# 由控制器回复ARP的地址，10.0.0.2和23个host
+ARP_HOSTS = dict((IPAddr('10.0.0.%s' % i), host_mac('10.0.0.%s' % i)) for i in [2] + range(11, 34))
+
+class ArpReplyCache(object):
+    """
+    预先打包好的ARP reply帧 {(ip, vlan): (帧, 以太网头长度)}，vlan为(id, pcp)或None
+    收到request时只需要把请求方的mac和ip写入帧中
+    不带vlan的帧启动时生成，带vlan的第一次用到时生成
+    mac_of不为None时，hosts以外的地址也回复，mac为mac_of(ip)
+    """
+    def __init__(self, hosts, mac_of=None):
+        self.hosts = dict(hosts)
+        self.mac_of = mac_of
+        self.frames = {}
+        for ip in hosts:
+            self.frames[(ip, None)] = self._build(ip, None)
+
+    def _build(self, ip, v):
+        r = arp()
+        r.opcode = arp.REPLY
+        r.hwsrc = self.hosts[ip]
+        r.protosrc = ip
+        e = ethernet(type=ethernet.ARP_TYPE, src=self.hosts[ip], dst=EthAddr('00:00:00:00:00:00'))
+        e.payload = r
+        if v is not None:
+            e.payload = vlan(eth_type = e.type,
+                             payload = e.payload,
+                             id = v[0],
+                             pcp = v[1])
+            e.type = ethernet.VLAN_TYPE
+        return bytearray(e.pack()), 18 if v is not None else 14
+
+    def __contains__(self, ip):
+        return ip in self.hosts or self.mac_of is not None
+
+    def reply(self, ip, v, hwdst, protodst):
+        """
+        返回回复给(hwdst, protodst)的ARP reply帧
+        """
+        if ip not in self.hosts:
+            self.hosts[ip] = self.mac_of(ip)
+        if (ip, v) not in self.frames:
+            self.frames[(ip, v)] = self._build(ip, v)
+        frame, n = self.frames[(ip, v)]
+        frame = bytearray(frame)
+        mac = hwdst.toRaw()
+        # 以太网目的地址，ARP的目的mac和目的ip
+        frame[0:6] = mac
+        frame[n+18:n+24] = mac
+        frame[n+24:n+28] = protodst.toRaw()
+        return bytes(frame)
+
+def arp_flows(hosts):
+    """
+    让ovs自己回复ARP request的流表，需要ovs支持Nicira扩展
+    把request原地改成reply后从入端口发回，带vlan的帧vlan tag保持不变
+    """
+    from pox.openflow import nicira as nx
+    msgs = []
+    for ip, mac in hosts.items():
+        msg = of.ofp_flow_mod()
+        msg.match.dl_type = ethernet.ARP_TYPE
+        msg.match.nw_proto = arp.REQUEST
+        msg.match.nw_dst = ip
+        msg.actions.append(nx.nx_reg_move(src=nx.NXM_OF_ETH_SRC, dst=nx.NXM_OF_ETH_DST))
+        msg.actions.append(of.ofp_action_dl_addr.set_src(mac))
+        msg.actions.append(nx.nx_reg_load(dst=nx.NXM_OF_ARP_OP, value=arp.REPLY))
+        msg.actions.append(nx.nx_reg_move(src=nx.NXM_NX_ARP_SHA, dst=nx.NXM_NX_ARP_THA))
+        msg.actions.append(nx.nx_reg_load(dst=nx.NXM_NX_ARP_SHA, value=int(mac.toStr(separator=''), 16)))
+        msg.actions.append(nx.nx_reg_move(src=nx.NXM_OF_ARP_SPA, dst=nx.NXM_OF_ARP_TPA))
+        msg.actions.append(nx.nx_reg_load(dst=nx.NXM_OF_ARP_SPA, value=ip.toUnsigned()))
+        msg.actions.append(of.ofp_action_output(port = of.OFPP_IN_PORT))
+        msgs.append(msg)
+    return msgs
+
 
 class NewMonitor(Event):
     """
@@ -42,108 +154,64 @@ class Handle_PacketIn(EventMixin):
                             NewMonitor,
                             ])
 
-    def __init__(self):
+    def __init__(self, proactive_arp=False, hosts=ARP_HOSTS, mac_of=None):
         log.debug("Handle_PacketIn coming up.")
+        self.hosts = hosts
+        self.arp_cache = ArpReplyCache(hosts, mac_of)
+        self.proactive_arp = proactive_arp
+        # 每类PacketIn的数量，每10秒输出一次
+        self.counters = Counter()
+        self.logged = Counter()
+        self.handlers = {
+            'arp': self._handle_arp,
+            'udp': self._handle_udp,
+        }
+        Timer(10, self._log_counters, recurring=True)
         # addListeners监听PacketIn事件
         core.openflow.addListeners(self)
         log.debug("handle_PacketIn startup.")
 
+    def _handle_ConnectionUp(self, event):
+        if self.proactive_arp:
+            event.connection.send(b''.join(msg.pack() for msg in arp_flows(self.hosts)))
+
     def _handle_PacketIn(self, event):
-       
-       #通知ovs丢弃数据包
-        def drop():
-            """Tell the switch to drop the packet"""
-            if event.ofp.buffer_id is not None: #nothing to drop because the packet is not in the Switch buffer
-                msg = of.ofp_packet_out()
-                msg.buffer_id = event.ofp.buffer_id 
-                event.ofp.buffer_id = None # Mark as dead, copied from James McCauley, not sure what it does but it does not work otherwise
-                msg.in_port = event.port
-                event.connection.send(msg)
-        #响应请求10.0.0.2的ARP request
-        def arp_response(a):
-            r = arp()
-            r.hwtype = a.hwtype
-            r.prototype = a.prototype
-            r.hwlen = a.hwlen
-            r.protolen = a.protolen
-            r.opcode = arp.REPLY
-            r.hwdst = a.hwsrc
-            r.protodst = a.protosrc
-            r.protosrc = a.protodst
-            r.hwsrc = EthAddr('00:00:00:00:00:02')
-            e = ethernet(type=packet.type, src=EthAddr('00:00:00:00:00:02'),
-                        dst=a.hwsrc)
-            e.payload = r
-            if packet.type == ethernet.VLAN_TYPE:
-                v_rcv = packet.find('vlan')
-                e.payload = vlan(eth_type = e.type,
-                                 payload = e.payload,
-                                 id = v_rcv.id,
-                                 pcp = v_rcv.pcp)
-                e.type = ethernet.VLAN_TYPE
-            msg = of.ofp_packet_out()
-            msg.data = e.pack()
-            msg.actions.append(of.ofp_action_output(port = of.OFPP_IN_PORT))
-            msg.in_port = event.port
-            event.connection.send(msg)
-
-        def arp_else_response(a, addr_id):
-            r = arp()
-            r.hwtype = a.hwtype
-            r.prototype = a.prototype
-            r.hwlen = a.hwlen
-            r.protolen = a.protolen
-            r.opcode = arp.REPLY
-            r.hwdst = a.hwsrc
-            r.protodst = a.protosrc
-            r.protosrc = a.protodst
-            r.hwsrc = EthAddr('00:00:00:00:00:%s'%addr_id)
-            e = ethernet(type=packet.type, src=EthAddr('00:00:00:00:00:%s'%addr_id),
-                        dst=a.hwsrc)
-            e.payload = r
-            if packet.type == ethernet.VLAN_TYPE:
-                v_rcv = packet.find('vlan')
-                e.payload = vlan(eth_type = e.type,
-                                 payload = e.payload,
-                                 id = v_rcv.id,
-                                 pcp = v_rcv.pcp)
-                e.type = ethernet.VLAN_TYPE
-            msg = of.ofp_packet_out()
-            msg.data = e.pack()
-            msg.actions.append(of.ofp_action_output(port = of.OFPP_IN_PORT))
-            msg.in_port = event.port
-            event.connection.send(msg)
-
-        #解析event
-        packet = event.parsed
-
-        #如果是要请求10.0.0.2的ARP request，响应它
-        if packet.find('arp'):
-            a = packet.find('arp')
-            if a:
-                if a.prototype == arp.PROTO_TYPE_IP:
-                    if a.hwtype == arp.HW_TYPE_ETHERNET:
-                        if a.protosrc != 0:
-                            if a.opcode == arp.REQUEST:
-                                # Maybe we can answer
-                                if a.protodst == IPAddr('10.0.0.2'):
-                                    log.debug("find arp REQUEST")
-                                    arp_response(a)
-                                else: 
-                                    arp_else_response(a,str(a.protodst).split('.')[3])
-        #探测到10.0.0.1的udp报文raiseEvent NewMonitor事件，通知Monitoring下发流表
-        elif packet.find('ipv4') and packet.find('udp') and not packet.find('icmp'):
-            # log.debug("switch %s port %s find udp packet.", util.dpid_to_str(event.connection.dpid), event.port)
-            ip_packet = packet.find('ipv4')
-            if ip_packet.srcip == IPAddr('10.0.0.1') and ip_packet.dstip == IPAddr('10.0.0.2'):
-                match = of.ofp_match.from_packet(packet)
-                match.dl_src, match.dl_dst = (None, None)
-                self.raiseEvent(NewMonitor(match = match, ip = ip_packet.srcip, hw = packet.src, dpid = event.dpid, switch_port = event.port))
-                log.debug("monitor find at switch %s", util.dpid_to_str(event.connection.dpid))
-        else:
-            # drop()
-            pass
-
-def launch ():
-    #注册Handle_PacketIn组件
-    core.registerNew(Handle_PacketIn)
+        kind, header, v = classify(event.parsed)
+        self.counters[kind] += 1
+        handler = self.handlers.get(kind)
+        if handler is not None:
+            handler(event, header, v)
+
+    def _log_counters(self):
+        if self.counters != self.logged:
+            log.debug("PacketIn: %s", ", ".join("%s %d" % c for c in sorted(self.counters.items())))
+            self.logged = Counter(self.counters)
+
+    #响应hosts中地址的ARP request
+    def _handle_arp(self, event, a, v):
+        if a.prototype != arp.PROTO_TYPE_IP or a.hwtype != arp.HW_TYPE_ETHERNET:
+            return
+        if a.protosrc == 0 or a.opcode != arp.REQUEST:
+            return
+        if a.protodst not in self.arp_cache:
+            return
+        log.debug("find arp REQUEST")
+        msg = of.ofp_packet_out()
+        msg.data = self.arp_cache.reply(a.protodst, v, a.hwsrc, a.protosrc)
+        msg.actions.append(of.ofp_action_output(port = of.OFPP_IN_PORT))
+        msg.in_port = event.port
+        event.connection.send(msg)
+
+    #探测到10.0.0.1的udp报文raiseEvent NewMonitor事件，通知Monitoring下发流表
+    def _handle_udp(self, event, ip_packet, v):
+        if ip_packet.srcip == MONITOR_SRC and ip_packet.dstip == MONITOR_DST:
+            packet = event.parsed
+            match = of.ofp_match.from_packet(packet)
+            match.dl_src, match.dl_dst = (None, None)
+            self.raiseEvent(NewMonitor(match = match, ip = ip_packet.srcip, hw = packet.src, dpid = event.dpid, switch_port = event.port))
+            log.debug("monitor find at switch %s", util.dpid_to_str(event.connection.dpid))
+
+def launch (proactive_arp=False):
+    #注册Handle_PacketIn组件，proactive_arp为True时下发由ovs回复ARP的流表
+    #其他10.0.0.x的ARP也由控制器回复，mac为00:00:00:00:00:x
+    core.registerNew(Handle_PacketIn, util.str_to_bool(proactive_arp), ARP_HOSTS, host_mac)
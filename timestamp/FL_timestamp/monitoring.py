@@ -66,35 +66,26 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
 
     def install_SDN_path():
 #===================================================================================
-        from readtopo import reversePath
+        from readtopo import shortest_paths
         s_ports = [4, 8, 7, 3, 4, 3, 8, 3, 5, 7, 4, 5, 6, 3, 3, 7, 7, 3, 5, 5, 5, 3, 3]
-        for i in range(0,23):
-            for j in range(0,23):
-                if i != j:
-                    # print i, j
-                    shortestPath = reversePath(str(i),str(j))
-                    for e,node in enumerate(shortestPath):
-                        # print shortestPath
-                        if node != shortestPath[-1]:
-                            node = int(node)+1
-                            nextnode = int(shortestPath[e+1])+1
-                            msg = of.ofp_flow_mod(match=monitor.match.clone())
-                            msg.match.dl_dst, msg.match.dl_src, msg.match.tp_dst, msg.match.tp_src= (None,) * 4
-                            msg.match.nw_src = IPAddr('10.0.0.%s'%(i+11))
-                            msg.match.nw_dst = IPAddr('10.0.0.%s'%(j+11))
-                            msg.actions.append(of.ofp_action_output(port=adj[node][nextnode]))
-                            # print node
-                            switches[node].connection.send(msg)
-                        else:
-                            node = int(node)+1
-                            # print node
-                            msg = of.ofp_flow_mod(match=monitor.match.clone())
-                            msg.match.dl_dst, msg.match.dl_src, msg.match.tp_dst, msg.match.tp_src= (None,) * 4
-                            msg.match.nw_src = IPAddr('10.0.0.%s'%(i+11))
-                            msg.match.nw_dst = IPAddr('10.0.0.%s'%(j+11))
-                            msg.actions.append(of.ofp_action_dl_addr.set_dst(dl_addr = EthAddr("00:00:00:00:00:%s"%(j+11))))
-                            msg.actions.append(of.ofp_action_output(port=s_ports[node-1]))
-                            switches[node].connection.send(msg)
+        routes = shortest_paths(adj, exclude=(monitor.dpid,))
+        # 每个目的host一棵最短路径树，每个交换机对每个目的只有一条流表，不匹配源地址
+        for j in range(0,23):
+            dst = j+1
+            if dst not in routes:
+                log.warning("s%s not discovered, no route to 10.0.0.%s", dst, j+11)
+                continue
+            # routes[dst][node]是dst到node的最短路径，反过来是node到dst的路径，path[-2]即下一跳
+            for node, path in routes[dst].items():
+                msg = of.ofp_flow_mod(match=monitor.match.clone())
+                msg.match.dl_dst, msg.match.dl_src, msg.match.tp_dst, msg.match.tp_src, msg.match.nw_src = (None,) * 5
+                msg.match.nw_dst = IPAddr('10.0.0.%s'%(j+11))
+                if node == dst:
+                    msg.actions.append(of.ofp_action_dl_addr.set_dst(dl_addr = EthAddr("00:00:00:00:00:%s"%(j+11))))
+                    msg.actions.append(of.ofp_action_output(port=s_ports[node-1]))
+                else:
+                    msg.actions.append(of.ofp_action_output(port=adj[node][path[-2]]))
+                switches[node].connection.send(msg)
 
         # msg = of.ofp_flow_mod(match=monitor.match.clone())
         # msg.match.dl_dst, msg.match.dl_src, msg.match.tp_dst, msg.match.tp_src= (None,) * 4
@@ -321,9 +312,15 @@ class Monitoring (object):
         _build_monitoring_topo(event)
     
     def _handle_LinkEvent(self, event):
+        from readtopo import invalidate_paths
         link = event.link
         if event.added:
-            adj[link.dpid1][link.dpid2] = link.port1
+            if adj[link.dpid1][link.dpid2] != link.port1:
+                adj[link.dpid1][link.dpid2] = link.port1
+                invalidate_paths()
+        elif event.removed:
+            if adj[link.dpid1].pop(link.dpid2, None) is not None:
+                invalidate_paths()
 
 def launch ():
     # 注册Monitoring组件
@@ -62,80 +62,45 @@ def readtopo():
 
     return links, monitors, paths, adj_path
 
-from collections import defaultdict
-from heapq import *
+from collections import deque
 
-def dijkstra(edges, f, t):
-    g = defaultdict(list)
-    for l,r,c in edges:
-        g[l].append((c,r))
+# {exclude: {src: {dst: [src, ..., dst]}}}
+_routes = {}
 
-    q, seen = [(0,f,())], set()
-    while q:
-        (cost,v1,path) = heappop(q)
-        if v1 not in seen:
-            seen.add(v1)
-            path = (v1, path)
-            if v1 == t: return (cost, path)
-
-            for c, v2 in g.get(v1, ()):
-                if v2 not in seen:
-                    heappush(q, (cost+c, v2, path))
+def shortest_paths(adj, exclude=()):
+    """
+    在发现的拓扑adj上从每个交换机做一次BFS，得到所有交换机之间的最短路径
+    返回 {src: {dst: [src, ..., dst]}}，节点为dpid
+    exclude中的交换机(如监测用的r24)不参与转发
+    只使用两个方向都已发现的链路，反过来的路径每一跳也都有端口
+    结果缓存，拓扑变化后调用invalidate_paths()
+    """
+    key = frozenset(exclude)
+    if key in _routes:
+        return _routes[key]
+    routes = {}
+    for src in [n for n in adj.keys() if n not in key]:
+        table = {src: [src]}
+        q = deque([src])
+        while q:
+            v = q.popleft()
+            for w in sorted(adj.get(v, {}).keys()):
+                if w not in table and w not in key and adj[v][w] is not None \
+                        and adj.get(w, {}).get(v) is not None:
+                    table[w] = table[v] + [w]
+                    q.append(w)
+        routes[src] = table
+    _routes[key] = routes
+    return routes
 
-    return float("inf")
+def invalidate_paths():
+    _routes.clear()
 
-def reversePath(src, dst):
-    edges = [
-        ("0", "2", 1), ("2", "0", 1),  # 1th
-        ("0", "6", 1), ("6", "0", 1),  # 2th
-        ("0", "15", 1), ("15", "0", 1),  # 3th
-        ("1", "3", 1), ("3", "1", 1),  # 4th
-        ("1", "6", 1), ("6", "1", 1),  # 5th
-        ("1", "11", 1), ("11", "1", 1),  # 6th
-        ("1", "12", 1), ("12", "1", 1),  # 7th
-        ("1", "17", 1), ("17", "1", 1),  # 8th
-        ("1", "22", 1), ("22", "1", 1),  # 9th
-        ("2", "9", 1), ("9", "2", 1),  # 10th
-        ("2", "20", 1), ("20", "2", 1),  # 11th
-        ("4", "7", 1), ("7", "4", 1),  # 12th
-        ("5", "6", 1), ("6", "5", 1),  # 13th
-        ("7", "8", 1), ("8", "7", 1),  # 14th
-        ("10", "2", 1), ("2", "10", 1),  # 15th
-        ("10", "9", 1), ("9", "10", 1),  # 16th
-        ("11", "9", 1), ("9", "11", 1),  # 17th
-        ("11", "21", 1), ("21", "11", 1),  # 18th
-        ("12", "13", 1), ("13", "12", 1),  # 19th
-        ("12", "16", 1), ("16", "12", 1),  # 20th
-        ("12", "18", 1), ("18", "12", 1),  # 21th
-        ("13", "2", 1), ("2", "13", 1),  # 22th
-        ("14", "8", 1), ("8", "14", 1),  # 23th
-        ("14", "19", 1), ("19", "14", 1),  # 24th
-        ("15", "3", 1), ("3", "15", 1),  # 25th
-        ("15", "4", 1), ("4", "15", 1),  # 26th
-        ("15", "8", 1), ("8", "15", 1),  # 27th
-        ("15", "9", 1), ("9", "15", 1),  # 28th
-        ("16", "6", 1), ("6", "16", 1),  # 29th
-        ("16", "9", 1), ("9", "16", 1),  # 30th
-        ("16", "19", 1), ("19", "16", 1),  # 31th
-        ("16", "22", 1), ("22", "16", 1),  # 32th
-        ("17", "20", 1), ("20", "17", 1),  # 33th
-        ("18", "5", 1), ("5", "18", 1),  # 34th
-        ("18", "6", 1), ("6", "18", 1),  # 35th
-        ("19", "21", 1), ("21", "19", 1),  # 36th
-        ("20", "6", 1), ("6", "20", 1)  # 37th
-    ]
-    out = dijkstra(edges, src, dst)
-    data = {}
-    data['cost'] = out[0]
-    aux = []
-    while len(out) > 1:
-        aux.append(out[0])
-        out = out[1]
-    aux.remove(data['cost'])
-    aux.reverse()
-    data['path'] = aux
-    a = data
-    return data['path']
+def reversePath(src, dst, adj, exclude=()):
+    """
+    src到dst的最短路径 [src, ..., dst]，不可达时返回None
+    """
+    return shortest_paths(adj, exclude).get(src, {}).get(dst)
 
 
 if __name__ == '__main__':
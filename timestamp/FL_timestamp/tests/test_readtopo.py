@@ -0,0 +1,54 @@
+#!/usr/bin/env python2
+#-*- coding: utf-8 -*-
+
+"""
+shortest_paths的测试，在timestamp/FL_timestamp目录下运行: python2 -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import readtopo
+
+def make_adj(links):
+    """
+    links: [(dpid1, dpid2, port1)]，只加入给出的方向
+    """
+    adj = defaultdict(lambda:defaultdict(lambda:None))
+    for a, b, port in links:
+        adj[a][b] = port
+    return adj
+
+class ShortestPathsTest(unittest.TestCase):
+    def setUp(self):
+        readtopo.invalidate_paths()
+
+    def test_asymmetric_link_not_used(self):
+        # 1-2-3的环，2->3只发现了一个方向，3到2要绕过1
+        adj = make_adj([(1, 2, 1), (2, 1, 1), (1, 3, 2), (3, 1, 1), (2, 3, 2)])
+        routes = readtopo.shortest_paths(adj)
+        self.assertEqual(routes[2][3], [2, 1, 3])
+        self.assertEqual(routes[3][2], [3, 1, 2])
+
+    def test_reversed_paths_have_ports(self):
+        # monitoring中把dst出发的路径反过来使用，每一跳都必须有端口
+        adj = make_adj([(1, 2, 1), (2, 1, 1), (2, 3, 2), (3, 2, 1),
+                        (3, 4, 2), (1, 4, 2), (4, 3, 1), (4, 5, 2), (5, 4, 1)])
+        routes = readtopo.shortest_paths(adj)
+        for dst in routes:
+            for node, path in routes[dst].items():
+                back = path[::-1]
+                for hop in zip(back, back[1:]):
+                    self.assertIsNotNone(adj[hop[0]][hop[1]])
+        self.assertEqual(routes[4][1], [4, 3, 2, 1])
+
+    def test_unreachable(self):
+        # 只有一个方向的链路两端互相不可达
+        adj = make_adj([(1, 2, 1)])
+        self.assertIsNone(readtopo.reversePath(1, 2, adj))
+        self.assertIsNone(readtopo.reversePath(2, 1, adj))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,7 @@ import pox.lib.packet as pkt
 import struct
 from pox.lib.addresses import IPAddr,EthAddr
 import time
+from probeheader import PORT, probe_port
 
 log = core.getLogger()
 switches = {}
@@ -91,8 +92,8 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
             #在第一层就返回的情况
             if len(p)==1:
                 msg = of.ofp_flow_mod(match=monitor.match.clone())
-                msg.match.nw_src, msg.match.tp_dst, msg.match.nw_dst = (None,) * 3
-                msg.match.tp_src = path_did[p]
+                msg.match.nw_src, msg.match.tp_src, msg.match.nw_dst = (None,) * 3
+                msg.match.tp_dst = probe_port(path_did[p])
                 msg.match.in_port=adj[p[0]][monitor.dpid]
                 msg.actions.append(of.ofp_action_output(port=of.OFPP_IN_PORT))
                 switches[p[0]].connection.send(msg)       
@@ -100,8 +101,8 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
                 # 到达第一层交换机
                 msg = of.ofp_flow_mod()
                 msg.match = monitor.match.clone()
-                msg.match.nw_src, msg.match.tp_dst, msg.match.nw_dst = (None,) * 3
-                msg.match.tp_src = path_did[p]
+                msg.match.nw_src, msg.match.tp_src, msg.match.nw_dst = (None,) * 3
+                msg.match.tp_dst = probe_port(path_did[p])
                 msg.match.in_port = adj[p[0]][monitor.dpid]
                 msg.actions.append(of.ofp_action_output(port=adj[p[0]][p[1]]))
                 switches[p[0]].connection.send(msg)
@@ -110,16 +111,16 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
                     if n < (len(p)-1):
                         msg=of.ofp_flow_mod()
                         msg.match=monitor.match.clone()
-                        msg.match.nw_src, msg.match.tp_dst, msg.match.nw_dst = (None,) * 3
-                        msg.match.tp_src = path_did[p]
+                        msg.match.nw_src, msg.match.tp_src, msg.match.nw_dst = (None,) * 3
+                        msg.match.tp_dst = probe_port(path_did[p])
                         msg.match.in_port=adj[p[n]][p[n-1]]
                         msg.actions.append(of.ofp_action_output(port=adj[p[n]][p[n+1]]))
                         switches[p[n]].connection.send(msg)
                     else:
                         msg = of.ofp_flow_mod()
                         msg.match = monitor.match.clone()
-                        msg.match.nw_src, msg.match.tp_dst, msg.match.nw_dst = (None,) * 3
-                        msg.match.tp_src = path_did[p]
+                        msg.match.nw_src, msg.match.tp_src, msg.match.nw_dst = (None,) * 3
+                        msg.match.tp_dst = probe_port(path_did[p])
                         msg.match.in_port = adj[p[n]][p[n-1]]
                         msg.actions.append(of.ofp_action_output(port=of.OFPP_IN_PORT))
                         switches[p[n]].connection.send(msg)
@@ -127,16 +128,16 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
                 for m in range((len(p)-2),0,-1):
                     msg=of.ofp_flow_mod()
                     msg.match=monitor.match.clone()
-                    msg.match.nw_src, msg.match.tp_dst, msg.match.nw_dst = (None,) * 3
-                    msg.match.tp_src = path_did[p]
+                    msg.match.nw_src, msg.match.tp_src, msg.match.nw_dst = (None,) * 3
+                    msg.match.tp_dst = probe_port(path_did[p])
                     msg.match.in_port=adj[p[m]][p[m+1]]
                     msg.actions.append(of.ofp_action_output(port=adj[p[m]][p[m-1]]))
                     switches[p[m]].connection.send(msg)
                 #返回到一层之后,返回到r24
                 msg=of.ofp_flow_mod()
                 msg.match=monitor.match.clone()
-                msg.match.nw_src, msg.match.tp_dst, msg.match.nw_dst = (None,) * 3
-                msg.match.tp_src = path_did[p]
+                msg.match.nw_src, msg.match.tp_src, msg.match.nw_dst = (None,) * 3
+                msg.match.tp_dst = probe_port(path_did[p])
                 msg.match.in_port=adj[p[0]][p[1]]
                 msg.actions.append(of.ofp_action_output(port=adj[p[0]][monitor.dpid]))
                 switches[p[0]].connection.send(msg)
@@ -270,6 +271,8 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
             msg.actions.append(of.ofp_action_nw_addr.set_src(nw_addr = IPAddr('10.0.0.2')))
             msg.actions.append(of.ofp_action_dl_addr.set_dst(dl_addr = monitor.hw))
             msg.actions.append(of.ofp_action_dl_addr.set_src(dl_addr = EthAddr("00:00:00:00:00:02")))
+            #目的端口改回PORT，monitor用一个socket接收所有path的probe
+            msg.actions.append(of.ofp_action_tp_port.set_dst(tp_port = PORT))
             msg.actions.append(of.ofp_action_output(port=monitor.switch_port))
             switches[monitor.dpid].connection.send(msg)
 
@@ -302,9 +305,9 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
         for p in path_did.keys():
             msg = of.ofp_flow_mod()
             msg.match = monitor.match.clone()
-            msg.match.tp_dst, msg.match.nw_src, msg.match.nw_dst =(None,) *3
+            msg.match.tp_src, msg.match.nw_src, msg.match.nw_dst =(None,) *3
             msg.match.in_port = monitor.switch_port
-            msg.match.tp_src=path_did[p]
+            msg.match.tp_dst=probe_port(path_did[p])
             msg.actions.append(of.ofp_action_nw_addr.set_src(nw_addr=IPAddr('10.0.1.2')))
             msg.actions.append(of.ofp_action_output(port=adj[monitor.dpid][p[0]]))  
             switches[monitor.dpid].connection.send(msg)
@@ -358,7 +361,7 @@ def _install_monitoring_path(monitor, monitors, paths, links, adj_path):
             #f.write("\n")
     
     with open("did_path.txt", "w") as m:
-        # 将每条路径的vid号和路径写入文件
+        # 将每条路径的path id和路径写入文件，probe头部和udp目的端口都携带path id
         m.write("did_path:\n")
         for p in path_did.keys():
             m.write("%6s -> " % path_did[p])
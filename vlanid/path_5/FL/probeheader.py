@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+
+"""
+probe头部: seq(u32) 发送时间ns(u64) path(u16) sender(u16)，网络字节序，放在udp payload开头
+和original/FL/udprecord.py的PAYLOAD格式相同，两边的抓包可以用同一种方式解析
+一个socket即可发送所有path的probe：path id同时编码在udp目的端口 PROBE_PORT + path id 中
+供交换机匹配，返回monitor前目的端口被改回PORT
+"""
+import struct
+
+PORT = 10000
+PROBE_PORT = 10000
+
+HEADER = struct.Struct('!IQHH')
+
+def probe_port(path):
+    return PROBE_PORT + path
+
+def encode(path, seq, send_time, sender=0):
+    return HEADER.pack(seq, int(send_time*1e9), path, sender)
+
+def decode(data):
+    """
+    返回 path, seq, send_time
+    """
+    seq, send_ns, path, sender = HEADER.unpack_from(data)
+    return path, seq, send_ns*1e-9
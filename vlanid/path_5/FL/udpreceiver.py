@@ -4,6 +4,7 @@
 from socket import *
 import time
 import sys
+from probeheader import decode
 
 HOST = '10.0.0.1'
 PORT = 10000
@@ -23,10 +24,12 @@ def main(is_print = None):
         while True:
             data, addr = udpSerSock.recvfrom(BUFSIZ)
             recvtime = time.time()
+            path, seq, send_time = decode(data)
             if is_print:
-                print "%6s %10.4fms"%(addr[1], (recvtime - eval(data)[1])*1000)
+                print "%6s %10.4fms"%(path, (recvtime - send_time)*1000)
                 continue
-            f_delay.write(repr((addr, data, recvtime))+'\n')
+            # 按原来的格式记录，源端口的位置写入头部中的path id
+            f_delay.write(repr(((addr[0], path), repr((seq, send_time)), recvtime))+'\n')
             #f_delay.flush()
     except :
         print "There was a timeout" 
@@ -8,6 +8,7 @@
 from socket import *
 import time
 import sys
+from probeheader import encode, probe_port
 
 HOST = '10.0.0.2'
 PORT = 10000
@@ -26,23 +27,26 @@ measure_time = 25
 n = int((measure_time/period) * 5 *(period / (interval*5 + time_interval)))
 # n = 2
 
+# 每个path的path id
+PATH_IDS = range(3, 46)
+
+udpCliSock = socket(AF_INET, SOCK_DGRAM)
+udpCliSock.bind(('10.0.0.1', 9999))
+
 def main():
-    for i in range(n):
-        #udpCliSock = socket(AF_INET, SOCK_DGRAM)
-        #udpCliSock.bind(('10.0.0.1', 9999))
-        # i += 1
-        #data = repr((i, time.time()))       
-        #udpCliSock.sendto(data, ADDR)
-        for m in range(3,46): 
-            udpCliSock = socket(AF_INET, SOCK_DGRAM)
-            udpCliSock.bind(('10.0.0.1', m))
-            data = repr((i, time.time()))
-            udpCliSock.sendto(data,ADDR)
-        if i%5==0:
-            print("send %d probe packet."%i)
-            time.sleep(time_interval - interval)
-        time.sleep(interval)
-    udpCliSock.close()
+    # path id放在probe头部和udp目的端口中，一个socket发送所有path的probe
+    addrs = [(path, (HOST, probe_port(path))) for path in PATH_IDS]
+    try:
+        for i in range(n):
+            # 每一轮所有path的probe连续发出
+            for path, addr in addrs:
+                udpCliSock.sendto(encode(path, i, time.time()), addr)
+            if i%5==0:
+                print("send %d probe packet."%i)
+                time.sleep(time_interval - interval)
+            time.sleep(interval)
+    finally:
+        udpCliSock.close()
 
 if __name__ == '__main__':
     main()